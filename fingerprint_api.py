@@ -26,6 +26,11 @@ Usage:
     # Return the raw template for custom processing
     python fingerprint_api.py acquire --raw --json
 
+    # Keep the scanner open; commands run with --use-daemon are forwarded
+    # to this process
+    python fingerprint_api.py serve
+    python fingerprint_api.py --use-daemon identify
+
 Environment:
     Ubuntu 22.04 x86_64 with ZKTeco Live20R fingerprint scanner
 
@@ -36,17 +41,65 @@ Date: 2025-03-08
 import os
 import sys
 import time
+import atexit
+import signal
+import socket
+import sqlite3
+import stat
+import struct
+import tempfile
 import base64
 import json
 import logging
+import logging.handlers
+import queue
 import builtins
 import ctypes
+import contextlib
+import functools
 import click
-from typing import Dict, Any, Optional, Union, List, Tuple
+from typing import Dict, Any, Optional, Union, List, Tuple, Iterator
+
+# pybase64 is an optional SIMD-accelerated drop-in for the stdlib codec
+try:
+    import pybase64
+    _b64encode = pybase64.b64encode
+except ImportError:
+    _b64encode = base64.b64encode
+
+# JSON output is pretty-printed for terminals only; pipes and files get
+# the compact form, which is cheaper to produce and to parse
+_PRETTY_JSON = sys.stdout.isatty()
+
+# orjson is an optional, much faster serializer for the CLI's JSON output
+try:
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_INDENT_2 if _PRETTY_JSON else 0
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    # --ndjson always writes compact lines, straight to stdout as bytes
+    _dumps_line = orjson.dumps
+except ImportError:
+    if _PRETTY_JSON:
+        def _dumps(obj: Any) -> str:
+            return json.dumps(obj, indent=2)
+    else:
+        def _dumps(obj: Any) -> str:
+            return json.dumps(obj, separators=(',', ':'))
+
+    def _dumps_line(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
 
 # Constants
 DEFAULT_LOG_PATH = "fingerprint_api.log"
 DEFAULT_DB_PATH = "fingerprints.db"
+DEFAULT_SOCKET_NAME = "api.sock"
+# Seconds the daemon waits for a client to send its request line; the
+# daemon serves one connection at a time, so a stalled client blocks others
+DAEMON_REQUEST_TIMEOUT = 5.0
 DEFAULT_SAMPLES = 3
 DEFAULT_MATCH_THRESHOLD = 60
 SUCCESS_CODE = 0
@@ -65,36 +118,140 @@ ERROR_CODES = {
     "PERMISSION_ERROR": ERROR_CODE_BASE + 10,
 }
 
-# Setup logging - file only, no console output
+# Responses that never vary are built once and shared; callers must treat
+# every returned dict as read-only
+RESPONSE_INITIALIZED = {"status": "success", "code": SUCCESS_CODE}
+RESPONSE_EMPTY_NAME = {
+    "status": "error",
+    "code": ERROR_CODES["INVALID_INPUT"],
+    "message": "User name cannot be empty",
+    "error_type": "invalid_input"
+}
+RESPONSE_INVALID_THRESHOLD = {
+    "status": "error",
+    "code": ERROR_CODES["INVALID_INPUT"],
+    "message": "Threshold must be between 0 and 100",
+    "error_type": "invalid_input"
+}
+RESPONSE_REGISTRATION_FAILED = {
+    "status": "error",
+    "code": ERROR_CODES["REGISTRATION_ERROR"],
+    "message": "Registration failed",
+    "error_type": "registration_error"
+}
+RESPONSE_NO_MATCH = {
+    "status": "failure",  # Not an error, just no match found
+    "code": SUCCESS_CODE,
+    "message": "No matching fingerprint found",
+    "match": False
+}
+RESPONSE_THRESHOLD_FAILED = {
+    "status": "error",
+    "code": ERROR_CODES["DEVICE_ERROR"],
+    "message": "Failed to set threshold",
+    "error_type": "device_error"
+}
+
+# Setup logging - file only, no console output. Records are queued and
+# written by a background thread so callers never block on disk I/O; the
+# file is only created once something is logged.
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-file_handler = logging.FileHandler(DEFAULT_LOG_PATH)
+file_handler = logging.FileHandler(DEFAULT_LOG_PATH, delay=True)
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(file_handler)
+log_queue = queue.Queue(-1)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
 logger.propagate = False
+log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
 
-# Redirect stdout/stderr to capture all output from the imported modules
-# We'll restore them later for JSON output
-original_stdout = sys.stdout
-original_stderr = sys.stderr
-null_file = open(os.devnull, 'w')
-sys.stdout = null_file
-sys.stderr = null_file
 
-try:
-    # Import the fingerprint manager from the main tool
+def _backend():
+    """
+    Return the fingerprint_tool module, importing it on first use.
+
+    The import pulls in zkfinger and sets up the tool's logging, so it is
+    deferred until a command actually runs in-process; commands forwarded
+    to the daemon, and --help, never pay for it. Callers silence output
+    around the first call.
+
+    Raises:
+        ImportError: If fingerprint_tool cannot be imported
+    """
+    import fingerprint_tool
+    return fingerprint_tool
+
+
+@functools.lru_cache(maxsize=None)
+def _libc() -> Optional[ctypes.CDLL]:
+    """
+    Return the C library of the running process, loaded on first use.
+
+    Used to flush stdio buffers written by the SDK. Only POSIX systems can
+    open the running process this way; elsewhere this returns None.
+    """
+    if os.name != "posix":
+        return None
     try:
-        from fingerprint_tool import FingerprintManager, zkfinger, TEMPLATE_SIZE
-    except ImportError:
-        # Restore stdout/stderr for the error message
-        sys.stdout = original_stdout
-        sys.stderr = original_stderr
-        print("Error: Could not import fingerprint_tool module")
-        sys.exit(1)
-finally:
-    # Restore stdout/stderr
-    sys.stdout = original_stdout
-    sys.stderr = original_stderr
+        return ctypes.CDLL(None)
+    except OSError as e:
+        logger.warning(f"Could not load the C library: {e}")
+        return None
+
+
+def _flush_all():
+    """Flush Python and C stdio buffers for stdout/stderr."""
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (AttributeError, ValueError, OSError):
+            pass
+    libc = _libc()
+    if libc is not None:
+        libc.fflush(None)
+
+
+def _api_call(op: str, sdk_error: Optional[Tuple[str, str]] = None,
+              error: Tuple[str, str] = ("UNKNOWN_ERROR", "Unexpected error")):
+    """
+    Wrap a FingerprintAPI method in the call protocol shared by all of them.
+
+    The wrapper initializes the API for `op`, silences SDK output while the
+    method runs, and turns exceptions into error responses, so the method
+    body only has to build its success/failure response.
+
+    Args:
+        op: Operation name, decides whether the scanner is opened
+        sdk_error: (ERROR_CODES key, message prefix) used for
+            zkfinger.ZKFingerError; None to treat it like any other exception
+        error: (ERROR_CODES key, message prefix) used for any other exception
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            init_result = self._initialize(op)
+            if init_result["status"] != "success":
+                return init_result
+
+            try:
+                # Redirect stdout/stderr while the SDK is in use
+                with self._silence_fds():
+                    return method(self, *args, **kwargs)
+            except Exception as e:
+                if sdk_error and isinstance(e, _backend().zkfinger.ZKFingerError):
+                    error_key, prefix = sdk_error
+                else:
+                    error_key, prefix = error
+                logger.error(f"{method.__name__} failed: {e}")
+                return {
+                    "status": "error",
+                    "code": ERROR_CODES[error_key],
+                    "message": f"{prefix}: {str(e)}",
+                    "error_type": error_key.lower()
+                }
+        return wrapper
+    return decorator
 
 
 class FingerprintAPI:
@@ -102,6 +259,16 @@ class FingerprintAPI:
     API wrapper for the fingerprint tool that provides JSON-formatted responses.
     """
 
+    __slots__ = ('db_path', 'fp_manager', 'lib_path')
+
+    # Descriptor for /dev/null, opened once at import and never closed
+    _devnull_fd = os.open(os.devnull, os.O_WRONLY)
+
+    # Operations that talk to the scanner; everything else is database-only
+    # and never pays for SDK initialization and device open. The threshold
+    # is a device parameter, so setting it needs the scanner too.
+    _NEEDS_DEVICE = frozenset({"acquire", "register", "verify", "identify", "threshold", "info", "serve"})
+
     def __init__(self, lib_path: str = "libzkfp.so", db_path: str = DEFAULT_DB_PATH):
         """
         Initialize the fingerprint API.
@@ -114,34 +281,73 @@ class FingerprintAPI:
         self.fp_manager = None
         self.lib_path = lib_path
 
-    def _initialize(self) -> Dict[str, Any]:
+    @contextlib.contextmanager
+    def _silence_fds(self):
+        """
+        Temporarily point file descriptors 1 and 2 at /dev/null.
+
+        libzkfp.so prints straight to the process descriptors, so rebinding
+        sys.stdout/sys.stderr alone does not silence it.
+        """
+        _flush_all()
+        saved_stdout = os.dup(1)
+        saved_stderr = os.dup(2)
+        os.dup2(self._devnull_fd, 1)
+        os.dup2(self._devnull_fd, 2)
+        try:
+            yield
+        finally:
+            # Drain anything buffered while silenced before restoring
+            _flush_all()
+            os.dup2(saved_stdout, 1)
+            os.dup2(saved_stderr, 2)
+            os.close(saved_stdout)
+            os.close(saved_stderr)
+
+    def _initialize(self, op: Optional[str] = None) -> Dict[str, Any]:
         """
         Initialize the fingerprint manager if not already initialized.
 
+        The database is always connected; the scanner is only opened for
+        operations listed in _NEEDS_DEVICE.
+
+        Args:
+            op: Name of the operation about to run
+
         Returns:
             Dict with success/error status
         """
-        if self.fp_manager is not None:
-            return {"status": "success", "code": SUCCESS_CODE}
+        needs_device = op in self._NEEDS_DEVICE
+        if self.fp_manager is not None and (self.fp_manager.device is not None or not needs_device):
+            return RESPONSE_INITIALIZED
 
         try:
             # Redirect stdout/stderr during initialization
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
-
-            try:
-                self.fp_manager = FingerprintManager(lib_path=self.lib_path, db_path=self.db_path)
-                return {"status": "success", "code": SUCCESS_CODE}
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
+            with self._silence_fds():
+                backend = _backend()
+        except ImportError as e:
+            logger.error(f"Could not import fingerprint_tool module: {e}")
+            return {
+                "status": "error",
+                "code": ERROR_CODES["INITIALIZATION_ERROR"],
+                "message": f"Could not import fingerprint_tool module: {str(e)}",
+                "error_type": "initialization_error"
+            }
 
-        except zkfinger.ZKFingerError as e:
+        try:
+            # Redirect stdout/stderr during initialization
+            with self._silence_fds():
+                if self.fp_manager is None:
+                    self.fp_manager = backend.FingerprintManager(
+                        lib_path=self.lib_path,
+                        db_path=self.db_path,
+                        open_device=False
+                    )
+                if needs_device:
+                    self.fp_manager.open_device()
+                return RESPONSE_INITIALIZED
+
+        except backend.zkfinger.ZKFingerError as e:
             logger.error(f"Fingerprint manager initialization failed: {e}")
             return {
                 "status": "error",
@@ -158,28 +364,26 @@ class FingerprintAPI:
                 "error_type": "unknown_error"
             }
 
+    def __enter__(self) -> 'FingerprintAPI':
+        """Context manager entry: returns self."""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit: releases the device and database."""
+        self.cleanup()
+
     def cleanup(self):
         """Clean up resources when done."""
         if self.fp_manager:
             try:
                 # Redirect stdout/stderr during cleanup
-                old_stdout = sys.stdout
-                old_stderr = sys.stderr
-                sys.stdout = open(os.devnull, 'w')
-                sys.stderr = open(os.devnull, 'w')
-
-                try:
+                with self._silence_fds():
                     self.fp_manager.cleanup()
                     self.fp_manager = None
-                finally:
-                    # Restore stdout/stderr
-                    sys.stdout.close()
-                    sys.stderr.close()
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
             except Exception as e:
                 logger.error(f"Error during cleanup: {e}")
 
+    @_api_call("acquire", sdk_error=("ACQUISITION_ERROR", "Acquisition failed"))
     def acquire_fingerprint(self, raw: bool = False) -> Dict[str, Any]:
         """
         Acquire a fingerprint from the scanner.
@@ -190,144 +394,70 @@ class FingerprintAPI:
         Returns:
             Dict with success/error status and template info
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
-        try:
-            # Acquire fingerprint with stdout/stderr redirected
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
-
-            try:
-                # Message will be invisible due to redirection
-                message = "Place your finger on the scanner to acquire fingerprint"
-                image_data, template_data = self.fp_manager._acquire_fingerprint(message)
-            except Exception as e:
-                logger.error(f"Error during fingerprint acquisition: {e}")
-                raise
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            response = {
-                "status": "success",
-                "code": SUCCESS_CODE,
-                "template_size": len(template_data),
-                "message": "Fingerprint acquired successfully"
-            }
-
-            if raw:
-                # Convert binary template to base64 for transmission
-                template_b64 = base64.b64encode(template_data).decode('utf-8')
-                response["template"] = template_b64
-
-            return response
-
-        except zkfinger.ZKFingerError as e:
-            logger.error(f"Fingerprint acquisition failed: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["ACQUISITION_ERROR"],
-                "message": f"Acquisition failed: {str(e)}",
-                "error_type": "acquisition_error"
-            }
-        except Exception as e:
-            logger.error(f"Unexpected error during fingerprint acquisition: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["UNKNOWN_ERROR"],
-                "message": f"Unexpected error: {str(e)}",
-                "error_type": "unknown_error"
-            }
-
-    def register_fingerprint(self, name: str, num_samples: int = DEFAULT_SAMPLES) -> Dict[str, Any]:
+        # Message will be invisible due to redirection
+        message = "Place your finger on the scanner to acquire fingerprint"
+        image_data, template_data = self.fp_manager._acquire_fingerprint(message)
+
+        response = {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "template_size": len(template_data),
+            "message": "Fingerprint acquired successfully"
+        }
+
+        if raw:
+            # Convert binary template to base64 for transmission
+            template_b64 = _b64encode(template_data).decode('ascii')
+            response["template"] = template_b64
+
+        return response
+
+    @_api_call("register", sdk_error=("REGISTRATION_ERROR", "Registration failed"))
+    def register_fingerprint(self, name: str, num_samples: int = DEFAULT_SAMPLES,
+                             overwrite: bool = True) -> Dict[str, Any]:
         """
         Register a new fingerprint.
 
+        Never prompts: the API may run with no terminal, as under `serve`.
+
         Args:
             name: User name to associate with the fingerprint
             num_samples: Number of fingerprint samples to capture
+            overwrite: Replace the user's template if the name is taken
 
         Returns:
             Dict with success/error status
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
         if not name:
-            return {
-                "status": "error",
-                "code": ERROR_CODES["INVALID_INPUT"],
-                "message": "User name cannot be empty",
-                "error_type": "invalid_input"
-            }
-
-        try:
-            # Redirect stdout/stderr during registration
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
-
-            try:
-                # Check if user already exists
-                users = self.fp_manager.list_users()
-                user_exists = any(user['name'] == name for user in users)
+            return RESPONSE_EMPTY_NAME
 
-                # Register fingerprint
-                result = self.fp_manager.register_fingerprint(name, num_samples=num_samples)
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            if result:
-                response = {
-                    "status": "success",
-                    "code": SUCCESS_CODE,
-                    "message": f"User '{name}' registered successfully",
-                    "user": {
-                        "name": name,
-                        "samples": num_samples,
-                        "overwritten": user_exists
-                    }
-                }
-            else:
-                response = {
-                    "status": "error",
-                    "code": ERROR_CODES["REGISTRATION_ERROR"],
-                    "message": "Registration failed",
-                    "error_type": "registration_error"
-                }
-
-            return response
-
-        except zkfinger.ZKFingerError as e:
-            logger.error(f"Fingerprint registration failed: {e}")
+        # Check if user already exists
+        user_exists = self.fp_manager.user_exists(name)
+        if user_exists and not overwrite:
             return {
                 "status": "error",
                 "code": ERROR_CODES["REGISTRATION_ERROR"],
-                "message": f"Registration failed: {str(e)}",
-                "error_type": "registration_error"
+                "message": f"User '{name}' already exists",
+                "error_type": "user_exists"
             }
-        except Exception as e:
-            logger.error(f"Unexpected error during fingerprint registration: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["UNKNOWN_ERROR"],
-                "message": f"Unexpected error: {str(e)}",
-                "error_type": "unknown_error"
+
+        # Register fingerprint
+        if not self.fp_manager.register_fingerprint(name, num_samples=num_samples,
+                                                    interactive=False, overwrite=overwrite):
+            return RESPONSE_REGISTRATION_FAILED
+
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "message": f"User '{name}' registered successfully",
+            "user": {
+                "name": name,
+                "samples": num_samples,
+                "overwritten": user_exists
             }
+        }
 
+    @_api_call("verify", sdk_error=("VERIFICATION_ERROR", "Verification failed"))
     def verify_fingerprint(self, name: str) -> Dict[str, Any]:
         """
         Verify a fingerprint against a specific user's template.
@@ -338,199 +468,101 @@ class FingerprintAPI:
         Returns:
             Dict with success/error status and match information
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
         if not name:
-            return {
-                "status": "error",
-                "code": ERROR_CODES["INVALID_INPUT"],
-                "message": "User name cannot be empty",
-                "error_type": "invalid_input"
-            }
-
-        try:
-            # Redirect stdout/stderr during verification
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
-
-            try:
-                # Check if user exists
-                users = self.fp_manager.list_users()
-                user_exists = any(user['name'] == name for user in users)
-
-                if not user_exists:
-                    # Restore stdout/stderr before returning
-                    sys.stdout.close()
-                    sys.stderr.close()
-                    sys.stdout = old_stdout
-                    sys.stderr = old_stderr
-
-                    return {
-                        "status": "error",
-                        "code": ERROR_CODES["VERIFICATION_ERROR"],
-                        "message": f"User '{name}' not found in the database",
-                        "error_type": "user_not_found"
-                    }
-
-                # Verify fingerprint
-                result = self.fp_manager.verify_fingerprint(name)
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            if result:
-                response = {
-                    "status": "success",
-                    "code": SUCCESS_CODE,
-                    "message": f"Verification successful for user '{name}'",
-                    "match": True,
-                    "user": {"name": name}
-                }
-            else:
-                response = {
-                    "status": "failure",  # Not an error, just a failed match
-                    "code": SUCCESS_CODE,
-                    "message": f"Fingerprint does not match user '{name}'",
-                    "match": False,
-                    "user": {"name": name}
-                }
-
-            return response
+            return RESPONSE_EMPTY_NAME
 
-        except zkfinger.ZKFingerError as e:
-            logger.error(f"Fingerprint verification failed: {e}")
+        # Check if user exists
+        if not self.fp_manager.user_exists(name):
             return {
                 "status": "error",
                 "code": ERROR_CODES["VERIFICATION_ERROR"],
-                "message": f"Verification failed: {str(e)}",
-                "error_type": "verification_error"
+                "message": f"User '{name}' not found in the database",
+                "error_type": "user_not_found"
             }
-        except Exception as e:
-            logger.error(f"Unexpected error during fingerprint verification: {e}")
+
+        # Verify fingerprint
+        if self.fp_manager.verify_fingerprint(name):
             return {
-                "status": "error",
-                "code": ERROR_CODES["UNKNOWN_ERROR"],
-                "message": f"Unexpected error: {str(e)}",
-                "error_type": "unknown_error"
+                "status": "success",
+                "code": SUCCESS_CODE,
+                "message": f"Verification successful for user '{name}'",
+                "match": True,
+                "user": {"name": name}
             }
 
-    def identify_fingerprint(self) -> Dict[str, Any]:
+        return {
+            "status": "failure",  # Not an error, just a failed match
+            "code": SUCCESS_CODE,
+            "message": f"Fingerprint does not match user '{name}'",
+            "match": False,
+            "user": {"name": name}
+        }
+
+    @_api_call("identify", sdk_error=("IDENTIFICATION_ERROR", "Identification failed"))
+    def identify_fingerprint(self, num_threads: int = 1) -> Dict[str, Any]:
         """
         Identify a fingerprint against all registered templates.
 
+        Args:
+            num_threads: Number of threads used to search the enrolled templates
+
         Returns:
             Dict with success/error status and identification information
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
-        try:
-            # Redirect stdout/stderr during identification
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
-
-            try:
-                # Identify fingerprint
-                identified_user = self.fp_manager.identify_fingerprint()
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            if identified_user:
-                response = {
-                    "status": "success",
-                    "code": SUCCESS_CODE,
-                    "message": f"Fingerprint identified as user '{identified_user}'",
-                    "match": True,
-                    "user": {"name": identified_user}
-                }
-            else:
-                response = {
-                    "status": "failure",  # Not an error, just no match found
-                    "code": SUCCESS_CODE,
-                    "message": "No matching fingerprint found",
-                    "match": False
-                }
+        identified_user = self.fp_manager.identify_fingerprint(num_threads=num_threads)
 
-            return response
+        if not identified_user:
+            return RESPONSE_NO_MATCH
 
-        except zkfinger.ZKFingerError as e:
-            logger.error(f"Fingerprint identification failed: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["IDENTIFICATION_ERROR"],
-                "message": f"Identification failed: {str(e)}",
-                "error_type": "identification_error"
-            }
-        except Exception as e:
-            logger.error(f"Unexpected error during fingerprint identification: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["UNKNOWN_ERROR"],
-                "message": f"Unexpected error: {str(e)}",
-                "error_type": "unknown_error"
-            }
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "message": f"Fingerprint identified as user '{identified_user}'",
+            "match": True,
+            "user": {"name": identified_user}
+        }
 
-    def list_users(self) -> Dict[str, Any]:
+    @_api_call("list", error=("USER_MANAGEMENT_ERROR", "Failed to list users"))
+    def list_users(self, limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
         """
-        List all registered users.
+        List registered users.
+
+        Args:
+            limit: Maximum number of users to return, or None for all
+            offset: Number of users to skip, in name order
 
         Returns:
             Dict with success/error status and user list
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
+        users = [user for user in self.iter_users(limit=limit, offset=offset)]
 
-        try:
-            # Redirect stdout/stderr during list operation
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "message": f"Found {len(users)} registered users",
+            "count": len(users),
+            "users": users
+        }
 
-            try:
-                # List users
-                users = self.fp_manager.list_users()
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
+    def iter_users(self, limit: Optional[int] = None, offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over registered users straight from the database cursor.
 
-            response = {
-                "status": "success",
-                "code": SUCCESS_CODE,
-                "message": f"Found {len(users)} registered users",
-                "count": len(users),
-                "users": users
-            }
+        The API must already be initialized (see _initialize).
 
-            return response
+        Args:
+            limit: Maximum number of users to return, or None for all
+            offset: Number of users to skip, in name order
 
-        except Exception as e:
-            logger.error(f"Error listing users: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
-                "message": f"Failed to list users: {str(e)}",
-                "error_type": "user_management_error"
-            }
+        Yields:
+            User dictionaries with 'id', 'name', and 'date_added' fields
+
+        Raises:
+            sqlite3.Error: If the database query fails
+        """
+        return self.fp_manager.iter_users(limit=limit, offset=offset)
 
+    @_api_call("delete", error=("USER_MANAGEMENT_ERROR", "Failed to delete user"))
     def delete_user(self, name: str) -> Dict[str, Any]:
         """
         Delete a user from the database.
@@ -541,60 +573,24 @@ class FingerprintAPI:
         Returns:
             Dict with success/error status
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
         if not name:
-            return {
-                "status": "error",
-                "code": ERROR_CODES["INVALID_INPUT"],
-                "message": "User name cannot be empty",
-                "error_type": "invalid_input"
-            }
-
-        try:
-            # Redirect stdout/stderr during deletion
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
+            return RESPONSE_EMPTY_NAME
 
-            try:
-                # Delete user
-                result = self.fp_manager.delete_user(name)
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            if result:
-                response = {
-                    "status": "success",
-                    "code": SUCCESS_CODE,
-                    "message": f"User '{name}' deleted successfully"
-                }
-            else:
-                response = {
-                    "status": "error",
-                    "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
-                    "message": f"User '{name}' not found or could not be deleted",
-                    "error_type": "user_not_found"
-                }
-
-            return response
-
-        except Exception as e:
-            logger.error(f"Error deleting user: {e}")
+        if not self.fp_manager.delete_user(name):
             return {
                 "status": "error",
                 "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
-                "message": f"Failed to delete user: {str(e)}",
-                "error_type": "user_management_error"
+                "message": f"User '{name}' not found or could not be deleted",
+                "error_type": "user_not_found"
             }
 
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "message": f"User '{name}' deleted successfully"
+        }
+
+    @_api_call("threshold", error=("DEVICE_ERROR", "Failed to set threshold"))
     def set_threshold(self, threshold: int) -> Dict[str, Any]:
         """
         Set the fingerprint matching threshold.
@@ -605,61 +601,20 @@ class FingerprintAPI:
         Returns:
             Dict with success/error status
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
         if threshold < 0 or threshold > 100:
-            return {
-                "status": "error",
-                "code": ERROR_CODES["INVALID_INPUT"],
-                "message": "Threshold must be between 0 and 100",
-                "error_type": "invalid_input"
-            }
+            return RESPONSE_INVALID_THRESHOLD
 
-        try:
-            # Redirect stdout/stderr during threshold setting
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
+        if not self.fp_manager.set_threshold(threshold):
+            return RESPONSE_THRESHOLD_FAILED
 
-            try:
-                # Set threshold
-                result = self.fp_manager.set_threshold(threshold)
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            if result:
-                response = {
-                    "status": "success",
-                    "code": SUCCESS_CODE,
-                    "message": f"Match threshold set to {threshold}",
-                    "threshold": threshold
-                }
-            else:
-                response = {
-                    "status": "error",
-                    "code": ERROR_CODES["DEVICE_ERROR"],
-                    "message": "Failed to set threshold",
-                    "error_type": "device_error"
-                }
-
-            return response
-
-        except Exception as e:
-            logger.error(f"Error setting threshold: {e}")
-            return {
-                "status": "error",
-                "code": ERROR_CODES["DEVICE_ERROR"],
-                "message": f"Failed to set threshold: {str(e)}",
-                "error_type": "device_error"
-            }
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "message": f"Match threshold set to {threshold}",
+            "threshold": threshold
+        }
 
+    @_api_call("info", error=("UNKNOWN_ERROR", "Failed to get system info"))
     def get_info(self) -> Dict[str, Any]:
         """
         Get system information, including device status and user count.
@@ -667,83 +622,430 @@ class FingerprintAPI:
         Returns:
             Dict with system information
         """
-        init_result = self._initialize()
-        if init_result["status"] != "success":
-            return init_result
-
-        try:
-            # Redirect stdout/stderr during info retrieval
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = open(os.devnull, 'w')
-            sys.stderr = open(os.devnull, 'w')
+        device_count = self.fp_manager.sdk.get_device_count()
+        user_count = self.fp_manager.count_users()
 
+        # Get device parameters if possible
+        device_info = {}
+        if self.fp_manager.device:
             try:
-                # Get system info
-                device_count = self.fp_manager.sdk.get_device_count()
-                users = self.fp_manager.list_users()
-
-                # Get device parameters if possible
-                device_info = {}
-                if self.fp_manager.device:
-                    try:
-                        device_info = {
-                            "width": self.fp_manager.device.get_parameter(1),  # Width
-                            "height": self.fp_manager.device.get_parameter(2),  # Height
-                            "dpi": self.fp_manager.device.get_parameter(3),     # DPI
-                        }
-                    except:
-                        device_info = {
-                            "width": "unknown",
-                            "height": "unknown",
-                            "dpi": "unknown"
-                        }
-            finally:
-                # Restore stdout/stderr
-                sys.stdout.close()
-                sys.stderr.close()
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
-
-            response = {
-                "status": "success",
-                "code": SUCCESS_CODE,
-                "system_info": {
-                    "device_count": device_count,
-                    "user_count": len(users),
-                    "database_path": self.db_path,
-                    "library_path": self.lib_path,
-                    "template_size": TEMPLATE_SIZE,
-                    "match_threshold": self.fp_manager.match_threshold,
-                    "device": device_info
+                # Read from the device once, then served from its cache
+                device_info = dict(self.fp_manager.device.device_geometry)
+            except _backend().zkfinger.ZKFingerError:
+                device_info = {
+                    "width": "unknown",
+                    "height": "unknown",
+                    "dpi": "unknown"
                 }
+
+        return {
+            "status": "success",
+            "code": SUCCESS_CODE,
+            "system_info": {
+                "device_count": device_count,
+                "user_count": user_count,
+                "database_path": self.db_path,
+                "library_path": self.lib_path,
+                "template_size": _backend().TEMPLATE_SIZE,
+                "match_threshold": self.fp_manager.match_threshold,
+                "device": device_info
             }
+        }
+
+
+# Daemon mode
+
+# CLI operations that can be forwarded to a running `serve` process,
+# mapped to the FingerprintAPI method that implements them
+DAEMON_OPERATIONS = {
+    "acquire": "acquire_fingerprint",
+    "register": "register_fingerprint",
+    "verify": "verify_fingerprint",
+    "identify": "identify_fingerprint",
+    "list": "list_users",
+    "delete": "delete_user",
+    "threshold": "set_threshold",
+    "info": "get_info",
+}
 
-            return response
 
-        except Exception as e:
-            logger.error(f"Error getting system info: {e}")
-            return {
+def _default_socket_path() -> str:
+    """
+    Return the per-user socket path used by `serve` and --use-daemon.
+
+    The socket lives in a directory private to the current user, under
+    $XDG_RUNTIME_DIR when it is set and in the temp directory otherwise.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        directory = os.path.join(runtime_dir, "fingerprint_api")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), f"fingerprint_api-{os.getuid()}")
+    return os.path.join(directory, DEFAULT_SOCKET_NAME)
+
+
+def _check_socket_dir(directory: str) -> Optional[str]:
+    """
+    Create the default socket directory if needed and check that it is private.
+
+    Args:
+        directory: Directory that will hold the daemon's socket
+
+    Returns:
+        None if the directory is owned by the current user with mode 0700,
+        otherwise a message describing the problem
+    """
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.lstat(directory)
+    except OSError as e:
+        return f"Cannot create socket directory {directory}: {e}"
+
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+        return f"Socket directory {directory} is not owned by the current user"
+    if stat.S_IMODE(st.st_mode) != 0o700:
+        return f"Socket directory {directory} must have mode 0700"
+    return None
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    """Return the uid of the process at the other end of sock, if the platform reports it."""
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    except (AttributeError, OSError):
+        return None
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def _daemon_paths(lib_path: str, db_path: str) -> Dict[str, str]:
+    """
+    Normalize the paths a forwarded command and the daemon must agree on.
+
+    A bare library name is kept as is, since the dynamic loader resolves
+    it through its search path rather than the working directory.
+
+    Args:
+        lib_path: Path to the ZKFinger SDK library
+        db_path: Path to the SQLite database
+
+    Returns:
+        Dict with the normalized "lib_path" and "db_path"
+    """
+    if os.sep in lib_path:
+        lib_path = os.path.abspath(lib_path)
+    return {"lib_path": lib_path, "db_path": os.path.abspath(db_path)}
+
+
+def _daemon_request(socket_path: Optional[str], op: str, params: Dict[str, Any],
+                    lib_path: str, db_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Forward an operation to a running `serve` process.
+
+    Args:
+        socket_path: Path to the daemon's Unix domain socket, None when
+                     forwarding is disabled
+        op: Operation name (a key of DAEMON_OPERATIONS)
+        params: Keyword arguments for the operation
+        lib_path: SDK library the command was started with
+        db_path: Database the command was started with
+
+    Returns:
+        The daemon's response, or None if the operation should run in-process
+        instead (no daemon listening or a daemon owned by another user)
+    """
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        # Stale socket file, no daemon behind it
+        sock.close()
+        return None
+
+    if _peer_uid(sock) != os.getuid():
+        logger.warning(f"Ignoring {socket_path}: the daemon is not run by the current user")
+        sock.close()
+        return None
+
+    try:
+        with sock, sock.makefile('rb') as reader:
+            request = dict(_daemon_paths(lib_path, db_path), op=op, params=params)
+            sock.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            reply = reader.readline()
+    except OSError as e:
+        reply = b""
+        logger.error(f"Daemon request '{op}' failed: {e}")
+
+    if not reply:
+        return {
+            "status": "error",
+            "code": ERROR_CODES["UNKNOWN_ERROR"],
+            "message": "Daemon closed the connection without a response",
+            "error_type": "unknown_error"
+        }
+
+    # The daemon may already have run the operation, so it must not be
+    # repeated in-process
+    try:
+        result = json.loads(reply)
+    except ValueError as e:
+        logger.error(f"Invalid daemon response to '{op}': {e}")
+        result = None
+    if not isinstance(result, dict) or "status" not in result:
+        logger.error(f"Invalid daemon response to '{op}': {reply!r}")
+        return {
+            "status": "error",
+            "code": ERROR_CODES["UNKNOWN_ERROR"],
+            "message": "Daemon sent an invalid response",
+            "error_type": "unknown_error"
+        }
+    return result
+
+
+def _dispatch_daemon_request(api: FingerprintAPI, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a decoded daemon request on the daemon's API.
+
+    Args:
+        api: The daemon's long-lived FingerprintAPI instance
+        request: Request sent by _daemon_request()
+
+    Returns:
+        Dict with the operation result, or an error if the request was made
+        for another library or database than the daemon's own
+    """
+    method = getattr(api, DAEMON_OPERATIONS[request["op"]])
+    served = _daemon_paths(api.lib_path, api.db_path)
+    requested = {"lib_path": request.get("lib_path"), "db_path": request.get("db_path")}
+    if requested != served:
+        logger.warning(f"Refused daemon request for {requested}, serving {served}")
+        return {
+            "status": "error",
+            "code": ERROR_CODES["INVALID_INPUT"],
+            "message": (
+                f"Daemon serves --lib-path {served['lib_path']} and "
+                f"--db-path {served['db_path']}; the command used "
+                f"{requested['lib_path']} and {requested['db_path']}"
+            ),
+            "error_type": "invalid_input"
+        }
+    return method(**request.get("params", {}))
+
+
+def _handle_daemon_connection(api: FingerprintAPI, conn: socket.socket):
+    """
+    Serve a single request received by the daemon.
+
+    Requests from other users, or for another library or database than the
+    daemon's own, are refused.
+
+    Args:
+        api: The daemon's long-lived FingerprintAPI instance
+        conn: Accepted client connection
+    """
+    conn.settimeout(DAEMON_REQUEST_TIMEOUT)
+    with conn, conn.makefile('rb') as reader:
+        try:
+            line = reader.readline()
+        except socket.timeout:
+            logger.warning(f"No daemon request received within {DAEMON_REQUEST_TIMEOUT}s")
+            line = None
+        except OSError as e:
+            logger.error(f"Could not read daemon request: {e}")
+            return
+        if line == b"":
+            return
+
+        try:
+            if line is None:
+                result = {
+                    "status": "error",
+                    "code": ERROR_CODES["INVALID_INPUT"],
+                    "message": f"Invalid daemon request: none received within {DAEMON_REQUEST_TIMEOUT}s",
+                    "error_type": "invalid_input"
+                }
+            elif _peer_uid(conn) != os.getuid():
+                logger.warning("Refused a daemon request from another user")
+                result = {
+                    "status": "error",
+                    "code": ERROR_CODES["PERMISSION_ERROR"],
+                    "message": "The daemon only serves its own user",
+                    "error_type": "permission_error"
+                }
+            else:
+                result = _dispatch_daemon_request(api, json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid daemon request: {e}")
+            result = {
                 "status": "error",
-                "code": ERROR_CODES["UNKNOWN_ERROR"],
-                "message": f"Failed to get system info: {str(e)}",
-                "error_type": "unknown_error"
+                "code": ERROR_CODES["INVALID_INPUT"],
+                "message": f"Invalid daemon request: {str(e)}",
+                "error_type": "invalid_input"
             }
 
+        try:
+            conn.sendall(json.dumps(result).encode('utf-8') + b"\n")
+        except OSError as e:
+            logger.error(f"Could not send daemon response: {e}")
+
+
+def _daemon_running(socket_path: str) -> bool:
+    """Check whether a daemon is accepting connections on socket_path."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def _run(ctx, op: str, **params) -> Dict[str, Any]:
+    """
+    Run an operation on the daemon if forwarding is enabled and one is
+    listening, otherwise in-process.
+
+    Args:
+        ctx: Click context holding the API and socket configuration
+        op: Operation name (a key of DAEMON_OPERATIONS)
+        **params: Keyword arguments for the operation
+
+    Returns:
+        Dict with the operation result
+    """
+    result = _daemon_request(ctx.obj['SOCKET'], op, params,
+                             ctx.obj['LIB_PATH'], ctx.obj['DB_PATH'])
+    if result is None:
+        with _get_api(ctx) as api:
+            result = getattr(api, DAEMON_OPERATIONS[op])(**params)
+    return result
+
+
+def _get_api(ctx) -> FingerprintAPI:
+    """
+    Return the in-process API, creating it on first use.
+
+    Commands answered by the daemon, and --help, never build one.
+
+    Args:
+        ctx: Click context holding the API factory
+
+    Returns:
+        The FingerprintAPI instance for this invocation
+    """
+    api = ctx.obj.get('API')
+    if api is None:
+        api = ctx.obj['API'] = ctx.obj['API_FACTORY']()
+    return api
+
+
+# Output rendering
+
+# Output modes, chosen once per invocation from --json/--no-json and --ndjson
+OUTPUT_TEXT = "text"
+OUTPUT_JSON = "json"
+OUTPUT_NDJSON = "ndjson"
+
+
+def _emit(output: str, result: Dict[str, Any], render):
+    """
+    Print a command result as JSON, as an NDJSON line or, with --no-json, as text.
+
+    Args:
+        output: Output mode, one of the OUTPUT_* constants
+        result: Operation result
+        render: Text renderer for non-error results
+    """
+    if output == OUTPUT_NDJSON:
+        click.echo(_dumps_line(result))
+    elif output == OUTPUT_JSON:
+        click.echo(_dumps(result))
+    elif result["status"] == "error":
+        _echo_error(result)
+    else:
+        # Text output for human readability
+        render(result)
+
+
+def _echo_error(result: Dict[str, Any]):
+    """Print the text form of an error result."""
+    click.echo("Error: " + result["message"])
+
+
+def _render_message(result: Dict[str, Any]):
+    click.echo(result["message"])
+
+
+def _render_acquire(result: Dict[str, Any]):
+    lines = [f"Fingerprint acquired successfully (size: {result['template_size']} bytes)"]
+    if "template" in result:
+        lines.append("Template data included in JSON output")
+    click.echo("\n".join(lines))
+
+
+def _render_verify(result: Dict[str, Any]):
+    name = result["user"]["name"]
+    if result["match"]:
+        click.echo(f"Verification successful for user '{name}'")
+    else:
+        click.echo(f"Verification failed for user '{name}'")
+
+
+def _render_identify(result: Dict[str, Any]):
+    if result["match"]:
+        click.echo(f"Identified user: {result['user']['name']}")
+    else:
+        click.echo("No matching fingerprint found")
+
+
+def _render_list(result: Dict[str, Any]):
+    lines = [f"Found {result['count']} registered users:"]
+    lines.extend(
+        f"- {user['name']} (ID: {user['id']}, Added: {user['date_added']})"
+        for user in result["users"]
+    )
+    click.echo("\n".join(lines))
+
+
+def _render_info(result: Dict[str, Any]):
+    info = result["system_info"]
+    lines = [
+        "System Information:",
+        f"- Device count: {info['device_count']}",
+        f"- User count: {info['user_count']}",
+        f"- Database path: {info['database_path']}",
+        f"- Match threshold: {info['match_threshold']}",
+        "Device Information:",
+    ]
+    lines.extend(f"- {key}: {value}" for key, value in info['device'].items())
+    click.echo("\n".join(lines))
+
 
 # Click CLI commands
 
 @click.group()
 @click.option('--lib-path', default="libzkfp.so", help="Path to the ZKFinger SDK library")
 @click.option('--db-path', default=DEFAULT_DB_PATH, help="Path to the SQLite database")
+@click.option('--use-daemon', is_flag=True, default=False,
+              help="Forward commands to a 'serve' daemon on the default socket")
+@click.option('--socket', 'socket_path', default=None,
+              help="Unix socket of the 'serve' daemon (implies --use-daemon)")
 @click.option('--debug/--no-debug', default=False, help="Enable debug logging")
 @click.option('--json/--no-json', default=True, help="Output results as JSON")
+@click.option('--ndjson', is_flag=True, default=False,
+              help="Output one compact JSON object per line (overrides --json)")
 @click.pass_context
-def cli(ctx, lib_path, db_path, debug, json):
+def cli(ctx, lib_path, db_path, use_daemon, socket_path, debug, json, ndjson):
     """
     Fingerprint API tool for programmatic interaction with ZKTeco scanners.
 
     This tool provides JSON-formatted responses for all operations.
+    With --use-daemon or --socket, commands are forwarded to a running
+    'serve' daemon, and run in this process when none is listening.
     """
     # Set debug level if requested
     if debug:
@@ -754,8 +1056,94 @@ def cli(ctx, lib_path, db_path, debug, json):
     ctx.ensure_object(dict)
     ctx.obj['LIB_PATH'] = lib_path
     ctx.obj['DB_PATH'] = db_path
-    ctx.obj['JSON'] = json
-    ctx.obj['API'] = FingerprintAPI(lib_path=lib_path, db_path=db_path)
+    if socket_path is None and use_daemon:
+        socket_path = _default_socket_path()
+    ctx.obj['SOCKET'] = socket_path
+    ctx.obj['OUTPUT'] = OUTPUT_NDJSON if ndjson else (OUTPUT_JSON if json else OUTPUT_TEXT)
+    ctx.obj['API_FACTORY'] = functools.partial(FingerprintAPI, lib_path=lib_path, db_path=db_path)
+
+
+@cli.command()
+@click.pass_context
+def serve(ctx):
+    """
+    Keep the scanner open and serve commands over a Unix domain socket.
+
+    Invocations of this tool run with --use-daemon (or the same --socket)
+    forward their command to this process, skipping SDK, device and database
+    initialization. Only the daemon's own user is served, and a forwarded
+    command must use the daemon's --lib-path and --db-path.
+    """
+    socket_path = ctx.obj['SOCKET']
+    output = ctx.obj['OUTPUT']
+
+    if socket_path is None:
+        socket_path = _default_socket_path()
+        problem = _check_socket_dir(os.path.dirname(socket_path))
+        if problem is not None:
+            logger.error(problem)
+            _emit(output, {
+                "status": "error",
+                "code": ERROR_CODES["PERMISSION_ERROR"],
+                "message": problem,
+                "error_type": "permission_error"
+            }, _render_message)
+            ctx.exit(1)
+
+    # Device and database stay open until the daemon exits
+    with _get_api(ctx) as api:
+        if _daemon_running(socket_path):
+            result = {
+                "status": "error",
+                "code": ERROR_CODES["INITIALIZATION_ERROR"],
+                "message": f"A daemon is already listening on {socket_path}",
+                "error_type": "initialization_error"
+            }
+        else:
+            result = api._initialize("serve")
+
+        if result["status"] != "success":
+            _emit(output, result, _render_message)
+            ctx.exit(1)
+
+        # Exit through SystemExit on SIGTERM so the socket and device are released
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # Only the owner may talk to the daemon
+            old_umask = os.umask(0o177)
+            try:
+                server.bind(socket_path)
+            finally:
+                os.umask(old_umask)
+            server.listen()
+
+            logger.info(f"Serving requests on {socket_path}")
+            _emit(output, {
+                "status": "success",
+                "code": SUCCESS_CODE,
+                "message": f"Serving requests on {socket_path}"
+            }, _render_message)
+
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError as e:
+                    # A client that gave up before being accepted
+                    logger.error(f"Could not accept daemon connection: {e}")
+                    continue
+                _handle_daemon_connection(api, conn)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            logger.info("Daemon stopped")
 
 
 @cli.command()
@@ -767,44 +1155,21 @@ def acquire(ctx, raw):
 
     If --raw is specified, the raw template data will be included in the response as a base64 string.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.acquire_fingerprint(raw=raw)
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "success":
-                click.echo(f"Fingerprint acquired successfully (size: {result['template_size']} bytes)")
-                if raw:
-                    click.echo(f"Template data included in JSON output")
-            else:
-                click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "acquire", raw=raw), _render_acquire)
 
 
 @cli.command()
 @click.option('--name', required=True, help="User name to associate with the fingerprint")
 @click.option('--samples', default=DEFAULT_SAMPLES, help="Number of samples to capture")
+@click.option('--overwrite/--no-overwrite', default=True,
+              help="Replace the template of an existing user")
 @click.pass_context
-def register(ctx, name, samples):
+def register(ctx, name, samples, overwrite):
     """
     Register a new fingerprint and associate it with a user name.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.register_fingerprint(name, num_samples=samples)
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "success":
-                click.echo(result["message"])
-            else:
-                click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "register", name=name, num_samples=samples,
+                                  overwrite=overwrite), _render_message)
 
 
 @cli.command()
@@ -814,67 +1179,158 @@ def verify(ctx, name):
     """
     Verify a fingerprint against a specific user's registered template.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.verify_fingerprint(name)
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "error":
-                click.echo(f"Error: {result['message']}")
-            elif result["match"]:
-                click.echo(f"Verification successful for user '{name}'")
-            else:
-                click.echo(f"Verification failed for user '{name}'")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "verify", name=name), _render_verify)
 
 
 @cli.command()
+@click.option('--threads', type=click.IntRange(min=1), default=1,
+              help="Threads used to search the enrolled templates")
 @click.pass_context
-def identify(ctx):
+def identify(ctx, threads):
     """
     Identify a fingerprint against all registered templates.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.identify_fingerprint()
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "error":
-                click.echo(f"Error: {result['message']}")
-            elif result["match"]:
-                click.echo(f"Identified user: {result['user']['name']}")
-            else:
-                click.echo("No matching fingerprint found")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "identify", num_threads=threads), _render_identify)
 
 
 @cli.command()
+@click.option('--limit', type=click.IntRange(min=0), default=None,
+              help="Maximum number of users to list")
+@click.option('--offset', type=click.IntRange(min=0), default=0,
+              help="Number of users to skip")
 @click.pass_context
-def list(ctx):
+def list(ctx, limit, offset):
     """
     List all registered users.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.list_users()
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
+    output = ctx.obj['OUTPUT']
+    result = _daemon_request(ctx.obj['SOCKET'], "list", {"limit": limit, "offset": offset},
+                             ctx.obj['LIB_PATH'], ctx.obj['DB_PATH'])
+    if result is None:
+        # In-process: stream rows as they come from SQLite instead of
+        # building the whole user list first
+        with _get_api(ctx) as api:
+            result = api._initialize("list")
             if result["status"] == "success":
-                click.echo(f"Found {result['count']} registered users:")
-                for user in result["users"]:
-                    click.echo(f"- {user['name']} (ID: {user['id']}, Added: {user['date_added']})")
+                _stream_users(ctx, output, api.iter_users(limit=limit, offset=offset))
+                return
+    elif output == OUTPUT_NDJSON and result["status"] == "success":
+        _write_user_lines(ctx, iter(result["users"]))
+        return
+
+    _emit(output, result, _render_list)
+
+
+def _write_user_lines(ctx, users: Iterator[Dict[str, Any]]):
+    """
+    Write one compact JSON line per user for --ndjson.
+
+    A failure while reading the database is reported as a final error line.
+
+    Args:
+        ctx: Click context, used to exit on a database error
+        users: Iterator of user dictionaries
+    """
+    try:
+        for user in users:
+            click.echo(_dumps_line(user))
+    except sqlite3.Error as e:
+        logger.error(f"Error listing users: {e}")
+        click.echo(_dumps_line({
+            "status": "error",
+            "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
+            "message": f"Failed to list users: {str(e)}",
+            "error_type": "user_management_error"
+        }))
+        ctx.exit(1)
+
+
+def _stream_users(ctx, output: str, users: Iterator[Dict[str, Any]]):
+    """
+    Write the `list` response incrementally, one user at a time.
+
+    The JSON document has the same fields as list_users(); "count" and
+    "message" follow the array since they are only known at the end.
+    Text output goes through _render_list() so it reads the same whether
+    it came from the daemon or from this process.
+
+    Args:
+        ctx: Click context, used to exit on a mid-stream failure
+        output: Output mode, one of the OUTPUT_* constants
+        users: Iterator of user dictionaries
+    """
+    if output == OUTPUT_NDJSON:
+        _write_user_lines(ctx, users)
+        return
+
+    if output == OUTPUT_TEXT:
+        # Text output is small; collect it so it renders exactly like the
+        # daemon's reply does through _render_list()
+        try:
+            listed = [user for user in users]
+        except sqlite3.Error as e:
+            logger.error(f"Error listing users: {e}")
+            _echo_error({
+                "status": "error",
+                "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
+                "message": f"Failed to list users: {str(e)}",
+                "error_type": "user_management_error"
+            })
+            ctx.exit(1)
+        _render_list({"count": len(listed), "users": listed})
+        return
+
+    # Layout pieces matching what _dumps() produces for the whole document
+    if _PRETTY_JSON:
+        newline, indent, space = "\n", "  ", " "
+    else:
+        newline, indent, space = "", "", ""
+    count = 0
+    try:
+        for user in users:
+            if count == 0:
+                click.echo(
+                    f'{{{newline}{indent}"status":{space}"success",'
+                    f'{newline}{indent}"code":{space}{SUCCESS_CODE},'
+                    f'{newline}{indent}"users":{space}[',
+                    nl=False
+                )
             else:
-                click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+                click.echo(",", nl=False)
+            row = _dumps(user)
+            if _PRETTY_JSON:
+                row = "\n    " + row.replace("\n", "\n    ")
+            click.echo(row, nl=False)
+            count += 1
+    except sqlite3.Error as e:
+        logger.error(f"Error listing users: {e}")
+        if count:
+            # Part of the document is already out; all we can do is fail loudly
+            click.echo(f"\nError: listing interrupted: {e}", err=True)
+            ctx.exit(1)
+        result = {
+            "status": "error",
+            "code": ERROR_CODES["USER_MANAGEMENT_ERROR"],
+            "message": f"Failed to list users: {str(e)}",
+            "error_type": "user_management_error"
+        }
+        click.echo(_dumps(result))
+        ctx.exit(1)
+
+    message = f"Found {count} registered users"
+    if count == 0:
+        click.echo(
+            f'{{{newline}{indent}"status":{space}"success",'
+            f'{newline}{indent}"code":{space}{SUCCESS_CODE},'
+            f'{newline}{indent}"users":{space}[]',
+            nl=False
+        )
+    else:
+        click.echo(f"{newline}{indent}]", nl=False)
+    click.echo(
+        f',{newline}{indent}"count":{space}{count},'
+        f'{newline}{indent}"message":{space}{_dumps(message)}{newline}}}'
+    )
 
 
 @cli.command()
@@ -884,19 +1340,7 @@ def delete(ctx, name):
     """
     Delete a user from the database.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.delete_user(name)
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "success":
-                click.echo(result["message"])
-            else:
-                click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "delete", name=name), _render_message)
 
 
 @cli.command()
@@ -906,19 +1350,7 @@ def threshold(ctx, value):
     """
     Set the fingerprint matching threshold.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.set_threshold(value)
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "success":
-                click.echo(result["message"])
-            else:
-                click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "threshold", threshold=value), _render_message)
 
 
 @cli.command()
@@ -927,27 +1359,7 @@ def info(ctx):
     """
     Get system information including device status and user count.
     """
-    api = ctx.obj['API']
-    try:
-        result = api.get_info()
-        if ctx.obj['JSON']:
-            click.echo(json.dumps(result, indent=2))
-        else:
-            # Text output for human readability
-            if result["status"] == "success":
-                info = result["system_info"]
-                click.echo("System Information:")
-                click.echo(f"- Device count: {info['device_count']}")
-                click.echo(f"- User count: {info['user_count']}")
-                click.echo(f"- Database path: {info['database_path']}")
-                click.echo(f"- Match threshold: {info['match_threshold']}")
-                click.echo("Device Information:")
-                for key, value in info['device'].items():
-                    click.echo(f"- {key}: {value}")
-                else:
-                    click.echo(f"Error: {result['message']}")
-    finally:
-        api.cleanup()
+    _emit(ctx.obj['OUTPUT'], _run(ctx, "info"), _render_info)
 
 if __name__ == "__main__":
     # Run the CLI
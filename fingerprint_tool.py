@@ -34,9 +34,9 @@ import time
 import sqlite3
 import logging
 import click
-import ctypes
 
-from typing import Optional, Tuple, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, List, Dict, Any, Iterator
 
 # Import the ZKFinger module
 import zkfinger
@@ -47,9 +47,8 @@ LOG_PATH = "fingerprint_tool.log"
 TEMPLATE_SIZE = 2048  # Maximum template size as defined in libzkfptype.h
 DEFAULT_MATCH_THRESHOLD = 60  # Default threshold for matching (0-100)
 DEFAULT_SAMPLES = 3  # Default number of samples for registration
-MAX_RETRIES = 10  # Max retries for fingerprint acquisition
-ACQUISITION_DELAY = 0.5  # Delay between acquisition attempts
-SETTLE_TIME = 2.0  # Initial sensor settle time
+MAX_ACQ_SECONDS = 7.0  # Time allowed for the finger to be placed
+ACQ_BACKOFF_MAX = 0.1  # Cap on the delay between capture attempts
 
 # Setup logging
 logging.basicConfig(
@@ -69,27 +68,99 @@ class FingerprintManager:
     and interfacing with the ZKFinger SDK.
     """
 
-    def __init__(self, lib_path: str = "libzkfp.so", db_path: str = DB_PATH):
+    def __init__(self, lib_path: str = "libzkfp.so", db_path: str = DB_PATH, open_device: bool = True):
         """
         Initialize the fingerprint manager.
 
         Args:
             lib_path: Path to the ZKFinger SDK library
             db_path: Path to the SQLite database
+            open_device: Open the scanner right away; pass False for
+                database-only work and call open_device() when needed
         """
+        self.lib_path = lib_path
         self.db_path = db_path
         self.sdk = None
         self.device = None
         self.fp_image_size = 0
         self.match_threshold = DEFAULT_MATCH_THRESHOLD
+        self._conn = None
+
+        # SDK caches holding every enrolled template for identification,
+        # and user id -> (name, cache) for the templates they hold
+        self._identify_caches = []
+        self._enrolled = {}
+        self._identify_version = None
+
+        # SDK cache used for 1:1 matching and merging, created on first use
+        self._match_cache = None
+
+        # Worker threads for sharded identification, kept between calls
+        self._identify_pool = None
+        self._identify_pool_size = 0
+
+        self.connect_db()
+        if open_device:
+            self.open_device()
+
+    def connect_db(self):
+        """
+        Open the manager's SQLite connection and prepare the schema.
+
+        The connection is kept until cleanup(), so SQLite's statement cache
+        spares every query from being re-parsed. Cheap, and safe to call
+        repeatedly.
+        """
+        if self._conn is not None:
+            return
+
+        try:
+            # Autocommit: every statement here is self-contained
+            conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,
+                cached_statements=128,
+                check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA mmap_size=268435456")
+        except sqlite3.Error as e:
+            logger.error(f"Could not open database {self.db_path}: {e}")
+            raise
+
+        self._conn = conn
+        self._init_database()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The manager's SQLite connection.
+
+        Reopened on first use after cleanup(), so database methods keep
+        working on a manager that has been cleaned up.
+        """
+        if self._conn is None:
+            self.connect_db()
+        return self._conn
+
+    def open_device(self):
+        """
+        Initialize the SDK and open the scanner, if not already open.
+
+        Raises:
+            zkfinger.ZKFingerError: If the SDK or device cannot be initialized
+        """
+        if self.device is not None:
+            return
 
-        # Initialize the SDK and open the device
         try:
-            self.sdk = zkfinger.ZKFingerSDK(lib_path=lib_path)
+            self.sdk = zkfinger.ZKFingerSDK(lib_path=self.lib_path)
             self._init_device()
-            self._init_database()
         except zkfinger.ZKFingerError as e:
             logger.error(f"Failed to initialize SDK: {e}")
+            self.sdk = None
             raise
 
     def _init_device(self):
@@ -117,7 +188,7 @@ class FingerprintManager:
         except zkfinger.ZKFingerError as e:
             logger.error(f"Device initialization failed: {e}")
             if self.sdk:
-                self.sdk.lib.ZKFPM_Terminate()
+                self.sdk.terminate()
             raise
 
     def _set_match_threshold(self, threshold: int):
@@ -138,8 +209,7 @@ class FingerprintManager:
     def _init_database(self):
         """Initialize the SQLite database."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self.conn.cursor()
 
             # Create users table if it doesn't exist
             cursor.execute('''
@@ -151,8 +221,6 @@ class FingerprintManager:
                 )
             ''')
 
-            conn.commit()
-            conn.close()
             logger.info(f"Database initialized at {self.db_path}")
         except sqlite3.Error as e:
             logger.error(f"Database initialization failed: {e}")
@@ -160,7 +228,7 @@ class FingerprintManager:
 
     def _acquire_fingerprint(self, message: str = "Place your finger on the scanner") -> Tuple[bytes, bytes]:
         """
-        Acquire a fingerprint from the device with retries and proper error handling.
+        Acquire a fingerprint from the device, waiting up to MAX_ACQ_SECONDS for a finger.
 
         Args:
             message: Message to display to the user
@@ -169,50 +237,38 @@ class FingerprintManager:
             Tuple of (image_data, template_data)
 
         Raises:
-            zkfinger.ZKFingerError: If fingerprint acquisition fails after all retries
+            zkfinger.ZKFingerError: If no finger was read in time (error code
+                ZKFP_ERR_CAPTURE) or the device reported another error
         """
         click.echo(f"\n{message}...")
 
-        # Allow the sensor to settle
-        time.sleep(SETTLE_TIME)
-
-        start_time = time.time()
-        for attempt in range(1, MAX_RETRIES + 1):
-            try:
-                # Try to acquire the fingerprint
-                image_data, template_data = self.device.acquire_fingerprint(
-                    fp_image_size=self.fp_image_size,
-                    fp_template_size=TEMPLATE_SIZE,
-                    max_retries=3,
-                    retry_delay=0
-                )
+        # The device polls the sensor, backing off between empty captures
+        start_time = time.monotonic()
+        image_data, template_data = self.device.acquire_fingerprint(
+            fp_image_size=self.fp_image_size,
+            fp_template_size=TEMPLATE_SIZE,
+            retry_delay=ACQ_BACKOFF_MAX,
+            timeout=MAX_ACQ_SECONDS
+        )
 
-                duration = time.time() - start_time
-                logger.info(f"Fingerprint acquired on attempt {attempt} (took {duration:.2f}s)")
-                click.echo(f"Fingerprint acquired successfully!")
+        duration = time.monotonic() - start_time
+        logger.info(f"Fingerprint acquired (took {duration:.2f}s)")
+        click.echo(f"Fingerprint acquired successfully!")
 
-                return image_data, template_data
+        return image_data, template_data
 
-            except zkfinger.ZKFingerError as e:
-                if "error -8" in str(e):  # Failed to capture image
-                    if attempt < MAX_RETRIES:
-                        click.echo(f"Attempt {attempt}/{MAX_RETRIES}: Waiting for finger placement... ")
-                        time.sleep(ACQUISITION_DELAY)
-                    else:
-                        raise zkfinger.ZKFingerError("Failed to capture fingerprint after maximum retries")
-                else:
-                    raise  # Re-raise other errors
-
-        # This should not be reached due to the raise in the loop
-        raise zkfinger.ZKFingerError("Failed to acquire fingerprint")
-
-    def register_fingerprint(self, name: str, num_samples: int = DEFAULT_SAMPLES) -> bool:
+    def register_fingerprint(self, name: str, num_samples: int = DEFAULT_SAMPLES,
+                             interactive: bool = True, overwrite: bool = False) -> bool:
         """
         Register a new fingerprint by acquiring multiple samples and storing in the database.
 
         Args:
             name: User name to associate with the fingerprint
             num_samples: Number of samples to capture for registration
+            interactive: Ask before overwriting a user and before each further
+                         sample; without a terminal (e.g. in the API daemon)
+                         pass False
+            overwrite: Whether an existing user is replaced when not interactive
 
         Returns:
             True if registration was successful, False otherwise
@@ -221,15 +277,17 @@ class FingerprintManager:
             click.echo("Error: User name cannot be empty")
             return False
 
+        if num_samples < 1:
+            click.echo("Error: At least one fingerprint sample is required")
+            return False
+
         # Check if user already exists
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
-        existing_user = cursor.fetchone()
-        conn.close()
-
-        if existing_user:
-            if not click.confirm(f"User '{name}' already exists. Do you want to overwrite?"):
+        if self.user_exists(name):
+            if not interactive:
+                if not overwrite:
+                    click.echo(f"User '{name}' already exists")
+                    return False
+            elif not click.confirm(f"User '{name}' already exists. Do you want to overwrite?"):
                 return False
 
         click.echo(f"\nRegistering fingerprint for user: {name}")
@@ -243,7 +301,8 @@ class FingerprintManager:
                 if i > 0:
                     click.echo("Please remove your finger")
                     time.sleep(1)
-                    click.confirm(f"Ready for sample {i+1}/{num_samples}?", default=True)
+                    if interactive:
+                        click.confirm(f"Ready for sample {i+1}/{num_samples}?", default=True)
 
                 _, template = self._acquire_fingerprint(f"[Sample {i+1}/{num_samples}] Place your finger on the scanner")
                 templates.append(template)
@@ -252,26 +311,7 @@ class FingerprintManager:
                 if i > 0:
                     # Use the SDK's DBMatch function to compare templates
                     try:
-                        # Create a temporary DB for matching
-                        db_cache = self.sdk.lib.ZKFPM_DBInit()
-                        if not db_cache:
-                            raise zkfinger.ZKFingerError("Failed to create temporary database for matching")
-
-                        # Set up C types for the comparison
-                        t1 = (ctypes.c_ubyte * len(templates[i-1]))(*templates[i-1])
-                        t2 = (ctypes.c_ubyte * len(template))(*template)
-
-                        # Call DBMatch
-                        score = self.sdk.lib.ZKFPM_DBMatch(
-                            db_cache,
-                            ctypes.cast(t1, ctypes.POINTER(ctypes.c_ubyte)),
-                            len(templates[i-1]),
-                            ctypes.cast(t2, ctypes.POINTER(ctypes.c_ubyte)),
-                            len(template)
-                        )
-
-                        # Free the temporary DB
-                        self.sdk.lib.ZKFPM_DBFree(db_cache)
+                        score = self.sdk.db_match(self._get_match_cache(), templates[i-1], template)
 
                         if score < self.match_threshold:
                             click.echo(f"Sample {i+1} does not match previous samples (score: {score})")
@@ -290,57 +330,46 @@ class FingerprintManager:
                 click.echo(f"Error acquiring fingerprint: {e}")
                 return False
 
-        # Create merged template from all samples
-        try:
-            # Create a temporary DB for merging
-            db_cache = self.sdk.lib.ZKFPM_DBInit()
-            if not db_cache:
-                raise zkfinger.ZKFingerError("Failed to create temporary database for merging")
-
-            # Convert templates to C types
-            c_templates = []
-            for template in templates:
-                c_template = (ctypes.c_ubyte * len(template))(*template)
-                c_templates.append(c_template)
-
-            # Prepare merged template buffer
-            merged_template = (ctypes.c_ubyte * TEMPLATE_SIZE)()
-            merged_size = ctypes.c_uint(TEMPLATE_SIZE)
-
-            # Call DBMerge
-            ret = self.sdk.lib.ZKFPM_DBMerge(
-                db_cache,
-                ctypes.cast(c_templates[0], ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(c_templates[1], ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(c_templates[2] if len(c_templates) > 2 else c_templates[1], ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(merged_template, ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.byref(merged_size)
-            )
-
-            # Free the temporary DB
-            self.sdk.lib.ZKFPM_DBFree(db_cache)
-
-            if ret != 0:  # ZKFP_ERR_OK
-                raise zkfinger.ZKFingerError(f"Template merge failed with error code: {ret}")
-
-            # Convert to bytes for storage
-            final_template = bytes(merged_template[:merged_size.value])
+        # Create merged template from all samples; a single sample has
+        # nothing to merge with and is stored as captured
+        if len(templates) == 1:
+            final_template = templates[0]
+        else:
+            try:
+                # DBMerge takes three templates; with two samples the second is repeated
+                final_template = self.sdk.db_merge(
+                    self._get_match_cache(),
+                    templates[0],
+                    templates[1],
+                    templates[2] if len(templates) > 2 else None
+                )
 
-        except Exception as e:
-            logger.error(f"Error creating merged template: {e}")
-            click.echo(f"Error creating merged template: {e}")
-            return False
+            except Exception as e:
+                logger.error(f"Error creating merged template: {e}")
+                click.echo(f"Error creating merged template: {e}")
+                return False
 
         # Store the template in the database
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO users (name, fingerprint) VALUES (?, ?)",
-                (name, final_template)
+            # Look up and replace in one transaction; rolled back on error
+            with self.conn:
+                cursor = self.conn.cursor()
+                cursor.execute("BEGIN")
+                before = self._enrolled_version()
+                cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
+                previous = cursor.fetchone()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO users (name, fingerprint) VALUES (?, ?)",
+                    (name, final_template)
+                )
+                user_id = cursor.lastrowid
+                after = self._enrolled_version()
+
+            self._update_identify_caches(
+                before, after,
+                removed_id=previous[0] if previous else None,
+                added=(user_id, name, final_template)
             )
-            conn.commit()
-            conn.close()
 
             logger.info(f"User '{name}' registered successfully")
             click.echo(f"\nUser '{name}' registered successfully!")
@@ -351,6 +380,36 @@ class FingerprintManager:
             click.echo(f"Database error: {e}")
             return False
 
+    def bulk_register(self, items: List[Tuple[str, bytes]]) -> int:
+        """
+        Store many (name, template) pairs in a single transaction.
+
+        Meant for imports and re-enrollment; existing users with the same
+        name are replaced. Either every row is written or none is.
+
+        Args:
+            items: (user name, fingerprint template) pairs
+
+        Returns:
+            Number of rows written
+
+        Raises:
+            sqlite3.Error: If the database write fails
+        """
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO users (name, fingerprint) VALUES (?, ?)",
+                items
+            )
+
+        # Rebuilt from the table on the next identify
+        if self._identify_caches:
+            self._free_identify_caches()
+
+        logger.info(f"Bulk registered {len(items)} users")
+        return len(items)
+
     def verify_fingerprint(self, name: str) -> bool:
         """
         Verify a fingerprint against a specific user's template.
@@ -367,11 +426,8 @@ class FingerprintManager:
 
         # Retrieve the stored template
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT fingerprint FROM users WHERE name = ?", (name,))
+            cursor = self.conn.execute("SELECT fingerprint FROM users WHERE name = ?", (name,))
             result = cursor.fetchone()
-            conn.close()
 
             if not result:
                 click.echo(f"User '{name}' not found in the database")
@@ -389,26 +445,7 @@ class FingerprintManager:
             click.echo(f"\nVerifying fingerprint for user: {name}")
             _, new_template = self._acquire_fingerprint("Place your finger on the scanner for verification")
 
-            # Create a temporary DB for matching
-            db_cache = self.sdk.lib.ZKFPM_DBInit()
-            if not db_cache:
-                raise zkfinger.ZKFingerError("Failed to create temporary database for matching")
-
-            # Convert templates to C types
-            c_stored = (ctypes.c_ubyte * len(stored_template))(*stored_template)
-            c_new = (ctypes.c_ubyte * len(new_template))(*new_template)
-
-            # Call DBMatch
-            score = self.sdk.lib.ZKFPM_DBMatch(
-                db_cache,
-                ctypes.cast(c_stored, ctypes.POINTER(ctypes.c_ubyte)),
-                len(stored_template),
-                ctypes.cast(c_new, ctypes.POINTER(ctypes.c_ubyte)),
-                len(new_template)
-            )
-
-            # Free the temporary DB
-            self.sdk.lib.ZKFPM_DBFree(db_cache)
+            score = self.sdk.db_match(self._get_match_cache(), stored_template, new_template)
 
             if score >= self.match_threshold:
                 logger.info(f"Verification successful for user '{name}' (score: {score})")
@@ -426,26 +463,162 @@ class FingerprintManager:
             click.echo(f"Error during verification: {e}")
             return False
 
-    def identify_fingerprint(self) -> Optional[str]:
+    def _enrolled_version(self) -> Tuple[int, int]:
+        """
+        Cheap change marker for the users table.
+
+        AUTOINCREMENT ids are never reused, so any insert, replace or delete
+        changes the (count, max id) pair.
+
+        Returns:
+            Tuple of (user_count, max_user_id)
+        """
+        cursor = self.conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM users")
+        return tuple(cursor.fetchone())
+
+    def _load_identify_caches(self, num_shards: int):
+        """
+        Make sure the SDK identification caches mirror the users table.
+
+        Templates are loaded once and kept for the manager's lifetime;
+        register_fingerprint and delete_user keep them in sync. They are only
+        rebuilt when the shard count changes or another process modified the
+        database.
+
+        Args:
+            num_shards: Number of DB caches to spread the templates over
+        """
+        version = self._enrolled_version()
+        if len(self._identify_caches) == num_shards and version == self._identify_version:
+            return
+
+        self._free_identify_caches()
+
+        self._identify_caches = [self.sdk.init_db_cache() for _ in range(num_shards)]
+        # Step the cursor rather than fetchall(), so only one template is
+        # held in Python at a time
+        for user_id, name, stored_template in self.conn.execute(
+                "SELECT id, name, fingerprint FROM users"):
+            self._enroll(user_id, name, stored_template)
+        self._identify_version = version
+        logger.debug(f"Loaded {len(self._enrolled)} templates into {num_shards} identification cache(s)")
+
+    def _enroll(self, user_id: int, name: str, template: bytes):
+        """Add a template to the identification caches, spreading users round-robin."""
+        db_cache = self._identify_caches[len(self._enrolled) % len(self._identify_caches)]
+        self.sdk.db_add(db_cache, user_id, template)
+        self._enrolled[user_id] = (name, db_cache)
+
+    def _update_identify_caches(self, before: Tuple[int, int], after: Tuple[int, int],
+                                removed_id: Optional[int] = None,
+                                added: Optional[Tuple[int, str, bytes]] = None):
+        """
+        Apply a users table change to the preloaded identification caches.
+
+        Both versions must be read in the transaction that made the change,
+        so nothing but this change lies between them.
+
+        Args:
+            before: _enrolled_version() just before the change
+            after: _enrolled_version() just after the change
+            removed_id: Id of a user that was deleted or replaced
+            added: (id, name, template) of a newly stored user
+        """
+        if not self._identify_caches:
+            return
+
+        if before != self._identify_version:
+            # Another process changed the table since the caches were
+            # loaded; applying only our change would hide theirs
+            logger.debug("Users table changed elsewhere; dropping identification caches")
+            self._free_identify_caches()
+            return
+
+        try:
+            if removed_id in self._enrolled:
+                _, db_cache = self._enrolled.pop(removed_id)
+                self.sdk.db_delete(db_cache, removed_id)
+            if added:
+                self._enroll(*added)
+            self._identify_version = after
+        except (zkfinger.ZKFingerError, sqlite3.Error) as e:
+            # Drop the caches; the next identification reloads them
+            logger.warning(f"Could not update identification caches: {e}")
+            self._free_identify_caches()
+
+    def _get_match_cache(self):
+        """
+        Return the SDK cache used for template matching and merging.
+
+        The cache is created on first use and kept until cleanup(), instead
+        of being allocated and freed around every comparison.
+
+        Returns:
+            DB cache handle
+
+        Raises:
+            zkfinger.ZKFingerError: If the cache cannot be created
+        """
+        if self._match_cache is None:
+            self._match_cache = self.sdk.init_db_cache()
+        return self._match_cache
+
+    def _free_identify_caches(self):
+        """Release the preloaded identification caches."""
+        for db_cache in self._identify_caches:
+            try:
+                self.sdk.free_db_cache(db_cache)
+            except zkfinger.ZKFingerError as e:
+                logger.error(f"Error freeing identification cache: {e}")
+        self._identify_caches = []
+        self._enrolled = {}
+        self._identify_version = None
+
+    def _identify_in_cache(self, db_cache, template: bytes) -> Tuple[Optional[int], int]:
+        """
+        Search one SDK cache for the best match of a template.
+
+        Args:
+            db_cache: DB cache handle holding enrolled templates
+            template: Probe template
+
+        Returns:
+            Tuple of (user_id, score); (None, 0) if the SDK found no candidate
+
+        Raises:
+            zkfinger.ZKFingerError: If the search itself fails
+        """
+        try:
+            return self.sdk.db_identify(db_cache, template)
+        except zkfinger.ZKFingerError as e:
+            # The SDK reports "no candidate" as an error code
+            if e.error_code != zkfinger.IDENTIFY_NO_CANDIDATE:
+                raise
+            return None, 0
+
+    def identify_fingerprint(self, num_threads: int = 1) -> Optional[str]:
         """
         Identify a fingerprint against all registered templates.
 
+        Args:
+            num_threads: Number of threads (and cache shards) used for the search
+
         Returns:
             User name if identification successful, None otherwise
+
+        Raises:
+            zkfinger.ZKFingerError: If the SDK fails to load or search the
+                identification caches
         """
-        # Get all registered templates
+        # Count the registered templates
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name, fingerprint FROM users")
-            users = cursor.fetchall()
-            conn.close()
+            user_count, _ = self._enrolled_version()
 
-            if not users:
+            if not user_count:
                 click.echo("No users registered in the database")
                 return None
 
-            logger.info(f"Attempting identification against {len(users)} registered users")
+            logger.info(f"Attempting identification against {user_count} registered users")
 
         except sqlite3.Error as e:
             logger.error(f"Database error during identification: {e}")
@@ -456,72 +629,141 @@ class FingerprintManager:
         try:
             click.echo("\nIdentifying fingerprint...")
             _, new_template = self._acquire_fingerprint("Place your finger on the scanner for identification")
+        except zkfinger.ZKFingerError as e:
+            logger.error(f"Error during identification: {e}")
+            click.echo(f"Error during identification: {e}")
+            return None
 
-            # Create a temporary DB for matching
-            db_cache = self.sdk.lib.ZKFPM_DBInit()
-            if not db_cache:
-                raise zkfinger.ZKFingerError("Failed to create temporary database for matching")
-
-            # Check against each stored template
-            best_match = None
-            best_score = 0
-
-            for name, stored_template in users:
-                # Convert templates to C types
-                c_stored = (ctypes.c_ubyte * len(stored_template))(*stored_template)
-                c_new = (ctypes.c_ubyte * len(new_template))(*new_template)
-
-                # Call DBMatch
-                score = self.sdk.lib.ZKFPM_DBMatch(
-                    db_cache,
-                    ctypes.cast(c_stored, ctypes.POINTER(ctypes.c_ubyte)),
-                    len(stored_template),
-                    ctypes.cast(c_new, ctypes.POINTER(ctypes.c_ubyte)),
-                    len(new_template)
-                )
+        # The 1:N search runs inside the library against the preloaded
+        # caches; with several threads each one searches its own shard
+        # and the best hit wins
+        self._load_identify_caches(max(1, min(num_threads, user_count)))
+        db_caches = self._identify_caches
 
-                logger.debug(f"Match score for user '{name}': {score}")
+        if len(db_caches) == 1:
+            results = [self._identify_in_cache(db_caches[0], new_template)]
+        else:
+            pool = self._get_identify_pool(len(db_caches))
+            futures = [
+                pool.submit(self._identify_in_cache, db_cache, new_template)
+                for db_cache in db_caches
+            ]
+            results = [future.result() for future in futures]
+
+        user_id, best_score = max(results, key=lambda result: result[1])
+        best_match = self._enrolled[user_id][0] if user_id in self._enrolled else None
+
+        if best_match and best_score >= self.match_threshold:
+            logger.info(f"Identification successful: matched user '{best_match}' (score: {best_score})")
+            click.echo(f"\nIdentification successful!")
+            click.echo(f"Matched user: {best_match}")
+            click.echo(f"Match score: {best_score} (threshold: {self.match_threshold})")
+            return best_match
+        else:
+            logger.info(f"Identification failed (best score: {best_score})")
+            click.echo(f"\nIdentification failed! No matching fingerprint found")
+            if best_match:
+                click.echo(f"Best match: {best_match} (score: {best_score}, threshold: {self.match_threshold})")
+            return None
 
-                if score > best_score:
-                    best_score = score
-                    best_match = name
+    def _get_identify_pool(self, num_threads: int) -> ThreadPoolExecutor:
+        """
+        Return the worker pool for sharded identification.
 
-            # Free the temporary DB
-            self.sdk.lib.ZKFPM_DBFree(db_cache)
+        The threads are reused by every identify with the same thread count,
+        which matters for a long-running process such as the API daemon.
 
-            if best_score >= self.match_threshold:
-                logger.info(f"Identification successful: matched user '{best_match}' (score: {best_score})")
-                click.echo(f"\nIdentification successful!")
-                click.echo(f"Matched user: {best_match}")
-                click.echo(f"Match score: {best_score} (threshold: {self.match_threshold})")
-                return best_match
-            else:
-                logger.info(f"Identification failed (best score: {best_score})")
-                click.echo(f"\nIdentification failed! No matching fingerprint found")
-                if best_match:
-                    click.echo(f"Best match: {best_match} (score: {best_score}, threshold: {self.match_threshold})")
-                return None
+        Args:
+            num_threads: Number of worker threads
 
-        except zkfinger.ZKFingerError as e:
-            logger.error(f"Error during identification: {e}")
-            click.echo(f"Error during identification: {e}")
-            return None
+        Returns:
+            Thread pool with num_threads workers
+        """
+        if self._identify_pool is None or self._identify_pool_size != num_threads:
+            if self._identify_pool is not None:
+                self._identify_pool.shutdown(wait=True)
+            self._identify_pool = ThreadPoolExecutor(
+                max_workers=num_threads,
+                thread_name_prefix="identify"
+            )
+            self._identify_pool_size = num_threads
+        return self._identify_pool
 
-    def list_users(self) -> List[Dict[str, Any]]:
+    def user_exists(self, name: str) -> bool:
         """
-        List all registered users.
+        Check whether a user is registered, without loading any templates.
+
+        Args:
+            name: User name to look up
+
+        Returns:
+            True if the user exists, False otherwise
+        """
+        # Served by the index SQLite keeps for the UNIQUE name column
+        cursor = self.conn.execute("SELECT 1 FROM users WHERE name = ? LIMIT 1", (name,))
+        return cursor.fetchone() is not None
+
+    def count_users(self) -> int:
+        """
+        Count registered users without loading any rows.
+
+        Returns:
+            Number of registered users
+
+        Raises:
+            sqlite3.Error: If the database query fails
+        """
+        cursor = self.conn.execute("SELECT COUNT(*) FROM users")
+        return cursor.fetchone()[0]
+
+    def iter_users(self, batch_size: int = 1000, limit: Optional[int] = None,
+                   offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over registered users without materializing the whole list.
+
+        Args:
+            batch_size: Number of rows fetched from SQLite at a time
+            limit: Maximum number of users to return, or None for all
+            offset: Number of users to skip, in name order
+
+        Yields:
+            User dictionaries with 'id', 'name', and 'date_added' fields
+
+        Raises:
+            sqlite3.Error: If the database query fails
+        """
+        query = "SELECT id, name, date_added FROM users ORDER BY name"
+        params = ()
+        if limit is not None or offset:
+            # A negative LIMIT means no limit to SQLite
+            query += " LIMIT ? OFFSET ?"
+            params = (-1 if limit is None else limit, offset)
+
+        # Plain tuple rows; building the dict directly is cheaper than
+        # going through sqlite3.Row
+        cursor = self.conn.cursor()
+        cursor.arraysize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for user_id, name, date_added in rows:
+                yield {"id": user_id, "name": name, "date_added": date_added}
+
+    def list_users(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        List registered users.
+
+        Args:
+            limit: Maximum number of users to return, or None for all
+            offset: Number of users to skip, in name order
 
         Returns:
             List of user dictionaries with 'id', 'name', and 'date_added' fields
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name, date_added FROM users ORDER BY name")
-            users = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            return users
+            return [user for user in self.iter_users(limit=limit, offset=offset)]
         except sqlite3.Error as e:
             logger.error(f"Database error while listing users: {e}")
             click.echo(f"Database error: {e}")
@@ -538,18 +780,23 @@ class FingerprintManager:
             True if deletion successful, False otherwise
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
-            user = cursor.fetchone()
+            # Look up and delete in one transaction, so the versions seen
+            # before and after differ only by this delete
+            with self.conn:
+                cursor = self.conn.cursor()
+                cursor.execute("BEGIN")
+                before = self._enrolled_version()
+                cursor.execute("SELECT id FROM users WHERE name = ?", (name,))
+                user = cursor.fetchone()
 
-            if not user:
-                click.echo(f"User '{name}' not found")
-                return False
+                if not user:
+                    click.echo(f"User '{name}' not found")
+                    return False
+
+                cursor.execute("DELETE FROM users WHERE id = ?", (user[0],))
+                after = self._enrolled_version()
 
-            cursor.execute("DELETE FROM users WHERE name = ?", (name,))
-            conn.commit()
-            conn.close()
+            self._update_identify_caches(before, after, removed_id=user[0])
 
             logger.info(f"User '{name}' deleted successfully")
             click.echo(f"User '{name}' deleted successfully")
@@ -574,6 +821,14 @@ class FingerprintManager:
             click.echo("Threshold must be between 0 and 100")
             return False
 
+        if self.device is None:
+            # Neither CLI gets here (both open the scanner for threshold);
+            # for a manager built with open_device=False, only this object's
+            # value changes, and open_device() writes it to the scanner
+            self.match_threshold = threshold
+            click.echo(f"Match threshold set to {threshold}")
+            return True
+
         try:
             self._set_match_threshold(threshold)
             click.echo(f"Match threshold set to {threshold}")
@@ -585,6 +840,20 @@ class FingerprintManager:
 
     def cleanup(self):
         """Close the device and cleanup resources."""
+        if self._identify_pool is not None:
+            self._identify_pool.shutdown(wait=True)
+            self._identify_pool = None
+
+        if self._identify_caches:
+            self._free_identify_caches()
+
+        if self._match_cache is not None:
+            try:
+                self.sdk.free_db_cache(self._match_cache)
+            except zkfinger.ZKFingerError as e:
+                logger.error(f"Error freeing match cache: {e}")
+            self._match_cache = None
+
         if self.device:
             try:
                 self.device.close()
@@ -594,14 +863,23 @@ class FingerprintManager:
 
         if self.sdk:
             try:
-                self.sdk.lib.ZKFPM_Terminate()
+                # Also frees any cache left behind by an earlier failure
+                self.sdk.terminate()
                 logger.info("SDK terminated")
             except Exception as e:
                 logger.error(f"Error terminating SDK: {e}")
 
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 
 # Click CLI commands
 
+# Subcommands that only touch the database and never need the scanner
+DB_ONLY_COMMANDS = ("list", "delete")
+
+
 @click.group(invoke_without_command=True)
 @click.option('--lib-path', default="libzkfp.so", help="Path to the ZKFinger SDK library")
 @click.option('--db-path', default=DB_PATH, help="Path to the SQLite database")
@@ -616,9 +894,13 @@ def cli(ctx, lib_path, db_path, debug):
         logger.setLevel(logging.DEBUG)
         logger.debug("Debug logging enabled")
 
-    # Initialize the fingerprint manager
+    # Initialize the fingerprint manager; database-only commands skip the scanner
     try:
-        ctx.obj = FingerprintManager(lib_path=lib_path, db_path=db_path)
+        ctx.obj = FingerprintManager(
+            lib_path=lib_path,
+            db_path=db_path,
+            open_device=ctx.invoked_subcommand not in DB_ONLY_COMMANDS
+        )
     except Exception as e:
         click.echo(f"Error initializing fingerprint manager: {e}")
         ctx.exit(1)
@@ -659,11 +941,13 @@ def verify(fp_manager, name):
 
 
 @cli.command()
+@click.option('--threads', type=click.IntRange(min=1), default=1,
+              help="Threads used to search the enrolled templates")
 @click.pass_obj
-def identify(fp_manager):
+def identify(fp_manager, threads):
     """Identify a fingerprint against all registered users"""
     try:
-        fp_manager.identify_fingerprint()
+        fp_manager.identify_fingerprint(num_threads=threads)
     except Exception as e:
         click.echo(f"Error during identification: {e}")
     finally:
@@ -671,11 +955,15 @@ def identify(fp_manager):
 
 
 @cli.command()
+@click.option('--limit', type=click.IntRange(min=0), default=None,
+              help="Maximum number of users to list")
+@click.option('--offset', type=click.IntRange(min=0), default=0,
+              help="Number of users to skip")
 @click.pass_obj
-def list(fp_manager):
+def list(fp_manager, limit, offset):
     """List all registered users"""
     try:
-        users = fp_manager.list_users()
+        users = fp_manager.list_users(limit=limit, offset=offset)
         if users:
             click.echo("\nRegistered users:")
             for user in users:
@@ -742,7 +1030,10 @@ def interactive_menu(fp_manager):
             click.pause()
 
         elif choice == 3:
-            fp_manager.identify_fingerprint()
+            try:
+                fp_manager.identify_fingerprint()
+            except zkfinger.ZKFingerError as e:
+                click.echo(f"Error during identification: {e}")
             click.pause()
 
         elif choice == 4:
@@ -777,8 +1068,5 @@ def interactive_menu(fp_manager):
 
 
 if __name__ == "__main__":
-    # Import ctypes for SDK functions that require it
-    import ctypes
-
     # Run the CLI
     cli()
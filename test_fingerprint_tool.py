@@ -15,127 +15,212 @@ Date: 2025-03-02
 import os
 import sys
 import time
+import ctypes
 import unittest
 import sqlite3
 import tempfile
+import json
+import socket
 import logging
+import threading
 from unittest import mock
 from contextlib import contextmanager
 
+from click.testing import CliRunner
+
 # Import the modules to test
 # Make sure these modules are in your PYTHONPATH
 try:
     # First try to import directly (if in the same directory)
-    import zkfinger_enhanced as zkf
-    from improved_fingerprint_tool import FingerprintManager
+    import zkfinger as zkf
+    import fingerprint_api
+    import fingerprint_tool
+    from fingerprint_tool import FingerprintManager
 except ImportError:
-    # Add parent directory to sys.path if needed
-    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    import zkfinger_enhanced as zkf
-    from improved_fingerprint_tool import FingerprintManager
+    # Add this file's directory to sys.path if needed
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import zkfinger as zkf
+    import fingerprint_api
+    import fingerprint_tool
+    from fingerprint_tool import FingerprintManager
 
 
 # Create a mock logger to avoid polluting test output
 logging.getLogger().setLevel(logging.CRITICAL)
 
+# ctypes array types used by the mocks; each (c_ubyte * N) builds a new class
+_PARAM_BUF_T = ctypes.c_ubyte * 4
+_TEMPLATE_BUF_T = ctypes.c_ubyte * 2048
+_C_UINT_P = ctypes.POINTER(ctypes.c_uint)
+
+# Sample fingerprint templates shared by the mock device and the tests
+SAMPLE_TEMPLATES = {
+    "user1": b'TEMPLATE_USER1' + b'\x00' * 100,
+    "user2": b'TEMPLATE_USER2' + b'\x00' * 100,
+    "user3": b'TEMPLATE_USER3' + b'\x00' * 100,
+}
+
+
+class MockLib:
+    """
+    Plain stand-in for the loaded libzkfp.so.
+
+    Calls with fixed results are methods here; MockSDK and MockDevice set
+    the stateful ones as instance attributes. Cheaper to build than a
+    MagicMock, and a call the tests did not expect fails loudly.
+    """
+
+    def ZKFPM_Init(self):
+        return 0  # Success
+
+    def ZKFPM_Terminate(self):
+        return 0  # Success
+
+    def ZKFPM_DBFree(self, db_cache):
+        return 0  # Success
+
+    def ZKFPM_DBClear(self, db_cache):
+        return 0  # Success
 
-class MockSDK:
-    """Mock ZKFingerSDK for testing without actual hardware."""
+    def ZKFPM_CloseDevice(self, device_handle):
+        return 0  # Success
 
-    def __init__(self, lib_path=None):
+
+class MockSDK(zkf.ZKFingerSDK):
+    """
+    Mock ZKFingerSDK for testing without actual hardware.
+
+    Device handling is mocked; the DB cache, matching and merging methods are
+    the real ones, running against MockLib.
+    """
+
+    # The real SDK binds these once in _setup_functions; looking them up on
+    # each call lets MockDevice and the tests swap the mock functions
+    _c_acquire = property(lambda self: self.lib.ZKFPM_AcquireFingerprint)
+    _c_set_parameters = property(lambda self: self.lib.ZKFPM_SetParameters)
+    _c_get_parameters = property(lambda self: self.lib.ZKFPM_GetParameters)
+    _c_dbmatch = property(lambda self: self.lib.ZKFPM_DBMatch)
+    _c_dbidentify = property(lambda self: self.lib.ZKFPM_DBIdentify)
+    _c_dbadd = property(lambda self: self.lib.ZKFPM_DBAdd)
+    _c_dbdel = property(lambda self: self.lib.ZKFPM_DBDel)
+    _c_dbcount = property(lambda self: self.lib.ZKFPM_DBCount)
+    _c_dbmerge = property(lambda self: self.lib.ZKFPM_DBMerge)
+
+    def __init__(self, lib_path=None, thread_safe=True):
         """Initialize the mock SDK."""
         self.terminated = False
         self.device_count = 1  # Simulate one connected device
         self.open_devices = []
-        self.db_caches = []
 
-        # Mock library
-        self.lib = mock.MagicMock()
-        self.lib.ZKFPM_Init.return_value = 0  # Success
-        self.lib.ZKFPM_Terminate.return_value = 0  # Success
-        self.lib.ZKFPM_GetDeviceCount.return_value = self.device_count
+        # Mock library, loaded by the real constructor in place of libzkfp.so
+        self.lib = MockLib()
+        with mock.patch('ctypes.CDLL', return_value=self.lib):
+            super().__init__(lib_path="libzkfp.so", thread_safe=thread_safe)
+        self.lib.ZKFPM_GetDeviceCount = lambda: self.device_count
 
         # Setup the DBInit function to create unique handles
         self.db_cache_counter = 0
         def mock_db_init():
             self.db_cache_counter += 1
             return self.db_cache_counter
-        self.lib.ZKFPM_DBInit.side_effect = mock_db_init
-
-        # Setup mock DB functions
-        self.lib.ZKFPM_DBFree.return_value = 0  # Success
-        self.lib.ZKFPM_DBAdd.return_value = 0  # Success
-        self.lib.ZKFPM_DBDel.return_value = 0  # Success
-        self.lib.ZKFPM_DBClear.return_value = 0  # Success
+        self.lib.ZKFPM_DBInit = mock_db_init
 
         # Mock templates will contain the user ID for easy testing
         self.templates = {}  # tid -> template
+        self._template_index = {}  # template -> tid, for exact-match identify
 
         # Setup DB match function
         def mock_db_match(db_cache, template1, len1, template2, len2):
             if template1 and template2:
-                # Convert to bytes for comparison
-                t1 = bytes(template1[:len1])
-                t2 = bytes(template2[:len2])
+                # Copy out for comparison in one go
+                t1 = ctypes.string_at(template1, len1)
+                t2 = ctypes.string_at(template2, len2)
                 # Return a match score based on similarity
                 if t1 == t2:
                     return 100  # Perfect match
-                elif t1[:len(t1)//2] == t2[:len(t2)//2]:
+                elif len1 // 2 == len2 // 2 and t2.startswith(t1[:len1 // 2]):
                     return 70  # Partial match
                 else:
                     return 30  # Poor match
             return 0  # No match
 
-        self.lib.ZKFPM_DBMatch.side_effect = mock_db_match
+        self.lib.ZKFPM_DBMatch = mock_db_match
 
         # Setup DB identify function
         def mock_db_identify(db_cache, template, len_template, tid_ptr, score_ptr):
-            t = bytes(template[:len_template])
-            best_score = 0
-            best_tid = 0
-
-            for tid, stored_template in self.templates.items():
-                if t == stored_template:
-                    score = 100
-                elif t[:len(t)//2] == stored_template[:len(stored_template)//2]:
-                    score = 70
-                else:
-                    score = 30
-
-                if score > best_score:
-                    best_score = score
-                    best_tid = tid
+            t = ctypes.string_at(template, len_template)
+            best_tid = self._template_index.get(t)
+            if best_tid is not None:
+                best_score = 100  # Exact match, no scan needed
+            else:
+                # The probe's first half is the same for every stored template
+                half_len = len_template // 2
+                t_half = t[:half_len]
+                best_score = 0
+                best_tid = 0
+
+                for tid, stored_template in self.templates.items():
+                    if len(stored_template) // 2 == half_len and stored_template.startswith(t_half):
+                        score = 70
+                    else:
+                        score = 30
+
+                    if score > best_score:
+                        best_score = score
+                        best_tid = tid
 
             if best_score >= 60:  # Threshold
                 # Set the output parameters
-                import ctypes
-                ctypes.memmove(tid_ptr, ctypes.byref(ctypes.c_uint(best_tid)), 4)
-                ctypes.memmove(score_ptr, ctypes.byref(ctypes.c_uint(best_score)), 4)
+                ctypes.cast(tid_ptr, _C_UINT_P)[0] = best_tid
+                ctypes.cast(score_ptr, _C_UINT_P)[0] = best_score
                 return 0  # Success
-            return -1  # No match
+            return zkf.IDENTIFY_NO_CANDIDATE  # No match
 
-        self.lib.ZKFPM_DBIdentify.side_effect = mock_db_identify
+        self.lib.ZKFPM_DBIdentify = mock_db_identify
+
+        # Setup DB add/delete functions; identify searches what was added
+        def mock_db_add(db_cache, tid, template, len_template):
+            self.add_template(tid, ctypes.string_at(template, len_template))
+            return 0  # Success
+
+        self.lib.ZKFPM_DBAdd = mock_db_add
+
+        def mock_db_del(db_cache, tid):
+            self.remove_template(tid)
+            return 0  # Success
+
+        self.lib.ZKFPM_DBDel = mock_db_del
 
         # Setup DB count function
         def mock_db_count(db_cache, count_ptr):
-            import ctypes
-            ctypes.memmove(count_ptr, ctypes.byref(ctypes.c_uint(len(self.templates))), 4)
+            ctypes.cast(count_ptr, _C_UINT_P)[0] = len(self.templates)
             return 0  # Success
 
-        self.lib.ZKFPM_DBCount.side_effect = mock_db_count
+        self.lib.ZKFPM_DBCount = mock_db_count
 
         # Setup DB merge function
         def mock_db_merge(db_cache, t1, t2, t3, merged, size_ptr):
-            import ctypes
             # Create a merged template (just use t1 for simplicity)
-            t1_bytes = bytes(t1[:100])  # Use first 100 bytes
-            # Copy to output buffer
-            ctypes.memmove(merged, t1, len(t1_bytes))
+            ctypes.memmove(merged, t1, len(t1))
             # Set size
-            ctypes.memmove(size_ptr, ctypes.byref(ctypes.c_uint(len(t1_bytes))), 4)
+            ctypes.cast(size_ptr, _C_UINT_P)[0] = len(t1)
             return 0  # Success
 
-        self.lib.ZKFPM_DBMerge.side_effect = mock_db_merge
+        self.lib.ZKFPM_DBMerge = mock_db_merge
+
+    def add_template(self, tid, template):
+        """Store a template where the mock identify can find it."""
+        self.templates[tid] = template
+        self._template_index.setdefault(template, tid)
+
+    def remove_template(self, tid):
+        """Forget a template stored with add_template."""
+        template = self.templates.pop(tid, None)
+        if self._template_index.get(template) == tid:
+            del self._template_index[template]
+
+    def _setup_functions(self):
+        """Nothing to bind; see the _c_* properties."""
 
     def get_device_count(self):
         """Get the number of connected devices."""
@@ -172,50 +257,40 @@ class MockDevice:
         self.height = 400
         self.image_size = self.width * self.height
 
-        # Sample fingerprint templates for testing
-        self.sample_templates = {
-            "user1": b'TEMPLATE_USER1' + b'\x00' * 100,
-            "user2": b'TEMPLATE_USER2' + b'\x00' * 100,
-            "user3": b'TEMPLATE_USER3' + b'\x00' * 100,
-        }
+        # Capture buffers reused by every acquire_fingerprint call
+        self._fp_image_buf = (ctypes.c_ubyte * self.image_size)()
+        self._fp_template_buf = _TEMPLATE_BUF_T()
 
-        # Setup mock functions
-        sdk.lib.ZKFPM_CloseDevice.return_value = 0  # Success
+        # Sample fingerprint templates for testing
+        self.sample_templates = SAMPLE_TEMPLATES
 
         # Mock the acquire fingerprint function
         def mock_acquire_fingerprint(device_handle, fp_image, fp_image_size, fp_template, template_size_ptr):
-            import ctypes
-            import time
-
             # Simulate device behavior
             if self.closed:
                 return -7  # Invalid handle
 
-            # Simulate a delay
-            time.sleep(0.1)
-
             # Get the sample template (use a default one if no specific one is set)
             template = getattr(self, 'current_template', self.sample_templates["user1"])
 
             # Copy template to output buffer
-            template_size = min(len(template), template_size_ptr.contents.value)
+            template_size_ptr = ctypes.cast(template_size_ptr, _C_UINT_P)
+            template_size = min(len(template), template_size_ptr[0])
             ctypes.memmove(fp_template, template, template_size)
 
             # Set actual template size
-            template_size_ptr.contents.value = template_size
+            template_size_ptr[0] = template_size
 
             # Create a dummy image (just zeros)
-            dummy_image = bytes([0] * min(fp_image_size, 1000))
+            dummy_image = bytes(min(fp_image_size, 1000))
             ctypes.memmove(fp_image, dummy_image, len(dummy_image))
 
             return 0  # Success
 
-        sdk.lib.ZKFPM_AcquireFingerprint.side_effect = mock_acquire_fingerprint
+        sdk.lib.ZKFPM_AcquireFingerprint = mock_acquire_fingerprint
 
         # Mock parameter functions
         def mock_get_parameters(device_handle, param_code, param_value, param_size_ptr):
-            import ctypes
-
             if param_code == 1:  # Width
                 value = self.width
             elif param_code == 2:  # Height
@@ -225,21 +300,22 @@ class MockDevice:
 
             # Convert to bytes and copy to output buffer
             value_bytes = value.to_bytes(4, byteorder='little')
-            size = min(len(value_bytes), param_size_ptr.contents.value)
+            param_size_ptr = ctypes.cast(param_size_ptr, _C_UINT_P)
+            size = min(len(value_bytes), param_size_ptr[0])
             ctypes.memmove(param_value, value_bytes, size)
 
             # Set actual size
-            param_size_ptr.contents.value = size
+            param_size_ptr[0] = size
 
             return 0  # Success
 
-        sdk.lib.ZKFPM_GetParameters.side_effect = mock_get_parameters
+        sdk.lib.ZKFPM_GetParameters = mock_get_parameters
 
         def mock_set_parameters(device_handle, param_code, param_value, param_size):
             # Just return success for all parameter sets
             return 0
 
-        sdk.lib.ZKFPM_SetParameters.side_effect = mock_set_parameters
+        sdk.lib.ZKFPM_SetParameters = mock_set_parameters
 
     def close(self):
         """Close the mock device."""
@@ -248,11 +324,17 @@ class MockDevice:
             if self in self.sdk.open_devices:
                 self.sdk.open_devices.remove(self)
 
+    @property
+    def device_geometry(self):
+        """Image geometry, as cached by the real device."""
+        return {"width": self.width, "height": self.height, "dpi": 500}
+
     def set_template(self, template):
         """Set the template that will be returned by acquire_fingerprint."""
         self.current_template = template
 
-    def acquire_fingerprint(self, fp_image_size=None, fp_template_size=2048, max_retries=10, retry_delay=0.1):
+    def acquire_fingerprint(self, fp_image_size=None, fp_template_size=2048, max_retries=10, retry_delay=0.1,
+                            timeout=None, copy=True):
         """Mock implementation of acquire_fingerprint."""
         if self.closed:
             raise zkf.ZKFingerError("Device is closed")
@@ -260,11 +342,17 @@ class MockDevice:
         if fp_image_size is None:
             fp_image_size = self.image_size
 
-        import ctypes
-
-        # Allocate buffers
-        fp_image = (ctypes.c_ubyte * fp_image_size)()
-        fp_template = (ctypes.c_ubyte * fp_template_size)()
+        # Reuse the device buffers when they are large enough
+        if fp_image_size <= self.image_size:
+            fp_image = self._fp_image_buf
+            ctypes.memset(fp_image, 0, fp_image_size)
+        else:
+            fp_image = (ctypes.c_ubyte * fp_image_size)()
+        if fp_template_size <= len(self._fp_template_buf):
+            fp_template = self._fp_template_buf
+            ctypes.memset(fp_template, 0, fp_template_size)
+        else:
+            fp_template = (ctypes.c_ubyte * fp_template_size)()
         template_size = ctypes.c_uint(fp_template_size)
 
         # Call the mocked function
@@ -279,9 +367,9 @@ class MockDevice:
         if ret != 0:
             raise zkf.ZKFingerError("Fingerprint acquisition failed", ret)
 
-        # Convert to bytes
-        image_data = bytes(fp_image)
-        template_data = bytes(fp_template[:template_size.value])
+        # Copy out only the requested sizes; the buffers may be larger
+        image_data = ctypes.string_at(fp_image, fp_image_size)
+        template_data = ctypes.string_at(fp_template, template_size.value)
 
         return image_data, template_data
 
@@ -290,10 +378,8 @@ class MockDevice:
         if self.closed:
             raise zkf.ZKFingerError("Device is closed")
 
-        import ctypes
-
         # Allocate buffer for parameter value (4 bytes for integer)
-        param_value = (ctypes.c_ubyte * 4)()
+        param_value = _PARAM_BUF_T()
         param_size = ctypes.c_uint(4)
 
         # Call the mocked function
@@ -317,13 +403,11 @@ class MockDevice:
         if self.closed:
             raise zkf.ZKFingerError("Device is closed")
 
-        import ctypes
-
         # Convert value to bytes
         value_bytes = value.to_bytes(4, byteorder='little')
 
         # Allocate buffer and copy value
-        param_value = (ctypes.c_ubyte * 4)(*value_bytes)
+        param_value = _PARAM_BUF_T.from_buffer_copy(value_bytes)
 
         # Call the mocked function
         ret = self.sdk.lib.ZKFPM_SetParameters(
@@ -350,6 +434,23 @@ def temp_database():
         os.unlink(path)
 
 
+# zkf.ZKFingerSDK is replaced once for the whole module; each test only
+# points the mock class at its own MockSDK
+_sdk_patcher = mock.patch('zkfinger.ZKFingerSDK')
+_sdk_class = None
+
+
+def setUpModule():
+    """Patch the SDK class for every test in this module."""
+    global _sdk_class
+    _sdk_class = _sdk_patcher.start()
+
+
+def tearDownModule():
+    """Restore the real SDK class."""
+    _sdk_patcher.stop()
+
+
 class TestZKFingerSDK(unittest.TestCase):
     """Unit tests for the ZKFinger SDK wrapper."""
 
@@ -358,10 +459,8 @@ class TestZKFingerSDK(unittest.TestCase):
         # Create a mock SDK
         self.sdk = MockSDK()
 
-        # Mock the zkf.ZKFingerSDK class to return our mock
-        patcher = mock.patch('zkfinger_enhanced.ZKFingerSDK', return_value=self.sdk)
-        self.addCleanup(patcher.stop)
-        patcher.start()
+        # Make zkf.ZKFingerSDK return our mock
+        _sdk_class.return_value = self.sdk
 
     def test_init_terminate(self):
         """Test SDK initialization and termination."""
@@ -405,7 +504,7 @@ class TestZKFingerSDK(unittest.TestCase):
         image, template = device.acquire_fingerprint()
 
         # Verify the returned template
-        self.assertEqual(template[:13], b'TEMPLATE_USER2')
+        self.assertEqual(template[:14], b'TEMPLATE_USER2')
 
         # Clean up
         device.close()
@@ -421,7 +520,7 @@ class TestZKFingerSDK(unittest.TestCase):
         # Add a template
         template = b'TEST_TEMPLATE' + b'\x00' * 100
         sdk.db_add(db_cache, 1, template)
-        sdk.templates[1] = template  # Add to mock templates
+        sdk.add_template(1, template)  # Add to mock templates
 
         # Get count
         count = sdk.db_count(db_cache)
@@ -439,6 +538,224 @@ class TestZKFingerSDK(unittest.TestCase):
         # Clean up
         sdk.free_db_cache(db_cache)
 
+    def test_free_waits_for_match(self):
+        """Freeing a DB cache waits for a match still running on it."""
+        sdk = zkf.ZKFingerSDK()
+        db_cache = sdk.init_db_cache()
+        template = SAMPLE_TEMPLATES["user1"]
+        events = []
+        match_started = threading.Event()
+        finish_match = threading.Event()
+
+        def slow_match(*args):
+            match_started.set()
+            finish_match.wait(5)
+            events.append("match")
+            return 100
+
+        def record_free(cache):
+            events.append("free")
+            return 0
+
+        sdk.lib.ZKFPM_DBMatch = slow_match
+        sdk.lib.ZKFPM_DBFree = record_free
+
+        matcher = threading.Thread(target=sdk.db_match, args=(db_cache, template, template))
+        matcher.start()
+        self.assertTrue(match_started.wait(5))
+        freer = threading.Thread(target=sdk.free_db_cache, args=(db_cache,))
+        freer.start()
+        freer.join(0.05)
+        self.assertTrue(freer.is_alive())
+
+        finish_match.set()
+        matcher.join(5)
+        freer.join(5)
+        self.assertEqual(events, ["match", "free"])
+
+
+    def test_identify_no_candidate(self):
+        """A miss raises IDENTIFY_NO_CANDIDATE without logging an error."""
+        sdk = MockSDK()
+        db_cache = sdk.init_db_cache()
+        self.addCleanup(sdk.free_db_cache, db_cache)
+        with self.assertLogs('zkfinger', level='DEBUG') as logs, \
+                self.assertRaises(zkf.ZKFingerError) as error:
+            sdk.db_identify(db_cache, SAMPLE_TEMPLATES["user1"])
+        self.assertEqual(error.exception.error_code, zkf.IDENTIFY_NO_CANDIDATE)
+        self.assertFalse([record for record in logs.records if record.levelno >= logging.ERROR])
+
+class TestFingerprintDevice(unittest.TestCase):
+    """Unit tests for zkfinger.FingerprintDevice running on the mock library."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.sdk = MockSDK()
+        # Opening a MockDevice installs the device functions in the mock library
+        self.mock_device = self.sdk.open_device(0)
+        self.mock_device.set_template(SAMPLE_TEMPLATES["user1"])
+        self.device = zkf.FingerprintDevice(self.sdk, self.mock_device.handle, 0)
+        self.addCleanup(self.device.close)
+
+        # Record the parameter codes read from and written to the SDK
+        self.get_calls = []
+        self.set_calls = []
+        get_parameters = self.sdk.lib.ZKFPM_GetParameters
+        set_parameters = self.sdk.lib.ZKFPM_SetParameters
+
+        def record_get(device_handle, param_code, param_value, param_size_ptr):
+            self.get_calls.append(param_code)
+            return get_parameters(device_handle, param_code, param_value, param_size_ptr)
+
+        def record_set(device_handle, param_code, param_value, param_size):
+            self.set_calls.append((param_code, int.from_bytes(bytes(param_value), 'little')))
+            return set_parameters(device_handle, param_code, param_value, param_size)
+
+        self.sdk.lib.ZKFPM_GetParameters = record_get
+        self.sdk.lib.ZKFPM_SetParameters = record_set
+
+    def test_param_cache(self):
+        """Parameter reads are cached for param_cache_ttl and dropped by any write."""
+        self.assertEqual(self.device.get_parameter(zkf.PARAM_CODE_WIDTH), 300)
+        self.assertEqual(self.device.get_parameter(zkf.PARAM_CODE_WIDTH), 300)
+        # Read once when the device was opened, then served from the cache
+        self.assertEqual(self.get_calls, [])
+
+        self.device.set_parameter(zkf.PARAM_CODE_DPI, 500)
+        self.device.get_parameter(zkf.PARAM_CODE_WIDTH)
+        self.assertEqual(self.get_calls, [zkf.PARAM_CODE_WIDTH])
+
+        # Expired entries are read again
+        expired = time.monotonic() + zkf.PARAM_CACHE_TTL + 1
+        with mock.patch('time.monotonic', return_value=expired):
+            self.device.get_parameter(zkf.PARAM_CODE_WIDTH)
+        self.assertEqual(self.get_calls, [zkf.PARAM_CODE_WIDTH] * 2)
+
+        # A TTL of 0 turns the cache off
+        self.device.param_cache_ttl = 0
+        self.device.get_parameter(zkf.PARAM_CODE_HEIGHT)
+        self.device.get_parameter(zkf.PARAM_CODE_HEIGHT)
+        self.assertEqual(self.get_calls[2:], [zkf.PARAM_CODE_HEIGHT] * 2)
+
+    def test_unchanged_writes_skipped(self):
+        """LED and template format writes are only sent when the value changes."""
+        self.device.set_led(green=True)
+        self.assertEqual(self.set_calls, [
+            (zkf.PARAM_CODE_WHITE_LIGHT, 0),
+            (zkf.PARAM_CODE_GREEN_LIGHT, 1),
+            (zkf.PARAM_CODE_RED_LIGHT, 0),
+        ])
+
+        self.set_calls.clear()
+        self.device.set_led(green=True)
+        self.assertEqual(self.set_calls, [])
+
+        self.device.set_led(red=True)
+        self.assertEqual(self.set_calls, [
+            (zkf.PARAM_CODE_GREEN_LIGHT, 0),
+            (zkf.PARAM_CODE_RED_LIGHT, 1),
+        ])
+
+        self.set_calls.clear()
+        self.device.set_template_format(True)
+        self.device.set_template_format(True)
+        self.assertEqual(self.set_calls, [(zkf.PARAM_CODE_FORMAT, 1)])
+
+        # The buzzer is always sent, each write is a new beep
+        self.set_calls.clear()
+        self.device.set_buzzer(True)
+        self.device.set_buzzer(True)
+        self.assertEqual(self.set_calls, [(zkf.PARAM_CODE_BUZZER, 1)] * 2)
+
+    def test_fatal_error_backoff(self):
+        """After the device is reported lost, acquisition fails without an SDK call."""
+        acquire = self.sdk.lib.ZKFPM_AcquireFingerprint
+        calls = []
+
+        def device_lost(*args):
+            calls.append(args)
+            return zkf.ZKFP_ERR_NODEVICE
+
+        self.sdk.lib.ZKFPM_AcquireFingerprint = device_lost
+        for _ in range(3):
+            with self.assertRaises(zkf.ZKFingerError) as cm:
+                self.device.acquire_fingerprint()
+            self.assertEqual(cm.exception.error_code, zkf.ZKFP_ERR_NODEVICE)
+        self.assertEqual(len(calls), 1)
+
+        # Past the window the SDK is tried again; a success clears the error
+        self.device.fatal_backoff = 0
+        self.sdk.lib.ZKFPM_AcquireFingerprint = acquire
+        self.device.acquire_fingerprint()
+        self.device.fatal_backoff = zkf.FATAL_BACKOFF
+        self.device.acquire_fingerprint()
+
+    def test_busy_error_not_cached(self):
+        """Errors that clear up on their own are not cached."""
+        calls = []
+
+        def busy(*args):
+            calls.append(args)
+            return zkf.ZKFP_ERR_BUSY
+
+        self.sdk.lib.ZKFPM_AcquireFingerprint = busy
+        for _ in range(2):
+            with self.assertRaises(zkf.ZKFingerError) as cm:
+                self.device.acquire_fingerprint()
+            self.assertEqual(cm.exception.error_code, zkf.ZKFP_ERR_BUSY)
+        self.assertEqual(len(calls), 2)
+
+    def test_capture_timeout(self):
+        """With no finger, polling stops at the timeout and keeps the capture error code."""
+        calls = []
+
+        def no_finger(*args):
+            calls.append(args)
+            return zkf.ZKFP_ERR_CAPTURE
+
+        self.sdk.lib.ZKFPM_AcquireFingerprint = no_finger
+        start = time.monotonic()
+        with self.assertRaises(zkf.ZKFingerError) as cm:
+            self.device.acquire_fingerprint(retry_delay=0.01, timeout=0.1)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(cm.exception.error_code, zkf.ZKFP_ERR_CAPTURE)
+        self.assertGreater(len(calls), 1)
+
+    def test_acquire_copy(self):
+        """copy=False returns a read-only view of the device's capture buffer."""
+        image, template = self.device.acquire_fingerprint()
+        self.assertIsInstance(image, bytes)
+        self.assertEqual(len(image), self.device.image_size)
+        self.assertEqual(template, SAMPLE_TEMPLATES["user1"])
+
+        image, template = self.device.acquire_fingerprint(copy=False)
+        self.assertIsInstance(image, memoryview)
+        self.assertTrue(image.readonly)
+        self.assertEqual(len(image), self.device.image_size)
+        self.assertEqual(template, SAMPLE_TEMPLATES["user1"])
+
+        # The view follows the buffer, which the next acquisition overwrites
+        self.device._image_buf[0] = 0x7F
+        self.assertEqual(image[0], 0x7F)
+
+    def test_not_thread_safe(self):
+        """thread_safe=False drops the SDK, DB cache and device locks."""
+        sdk = MockSDK(thread_safe=False)
+        mock_device = sdk.open_device(0)
+        device = zkf.FingerprintDevice(sdk, mock_device.handle, 0)
+        self.addCleanup(device.close)
+        self.assertIs(sdk._lock, zkf._NULL_LOCK)
+        self.assertIs(device._lock, zkf._NULL_LOCK)
+
+        db_cache = sdk.init_db_cache()
+        self.assertIs(sdk._db_cache_lock(db_cache), zkf._NULL_LOCK)
+        sdk.db_add(db_cache, 1, SAMPLE_TEMPLATES["user1"])
+        self.assertEqual(sdk.db_count(db_cache), 1)
+
+        _, template = device.acquire_fingerprint()
+        self.assertEqual(sdk.db_identify(db_cache, template), (1, 100))
+        sdk.free_db_cache(db_cache)
+
 
 class TestFingerprintManager(unittest.TestCase):
     """Unit tests for the FingerprintManager class."""
@@ -448,29 +765,28 @@ class TestFingerprintManager(unittest.TestCase):
         # Create a mock SDK
         self.mock_sdk = MockSDK()
 
-        # Create a temporary database
-        self.db_fd, self.db_path = tempfile.mkstemp()
-        os.close(self.db_fd)
+        # In-memory database: a FingerprintManager keeps one connection,
+        # so the data lives exactly as long as the manager does
+        self.db_path = ":memory:"
 
-        # Mock the zkf.ZKFingerSDK class
-        self.sdk_patcher = mock.patch('zkfinger_enhanced.ZKFingerSDK', return_value=self.mock_sdk)
-        self.addCleanup(self.sdk_patcher.stop)
-        self.sdk_patcher.start()
+        # Make zkf.ZKFingerSDK return our mock
+        _sdk_class.return_value = self.mock_sdk
 
         # Prepare sample templates
-        self.sample_templates = {
-            "user1": b'TEMPLATE_USER1' + b'\x00' * 100,
-            "user2": b'TEMPLATE_USER2' + b'\x00' * 100,
-            "user3": b'TEMPLATE_USER3' + b'\x00' * 100,
-        }
+        self.sample_templates = SAMPLE_TEMPLATES
 
-    def tearDown(self):
-        """Tear down test fixtures."""
-        os.unlink(self.db_path)
+        # Registration asks before each further sample and waits for the
+        # finger to be lifted
+        self.click_confirm_patcher = mock.patch('click.confirm', return_value=True)
+        self.click_confirm_patcher.start()
+        self.addCleanup(self.click_confirm_patcher.stop)
+        self.sleep_patcher = mock.patch('time.sleep')
+        self.sleep_patcher.start()
+        self.addCleanup(self.sleep_patcher.stop)
 
     def test_init(self):
         """Test FingerprintManager initialization."""
-        with mock.patch('improved_fingerprint_tool.zkfinger', zkf):
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
             manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
             self.assertIsNotNone(manager.sdk)
             self.assertIsNotNone(manager.device)
@@ -478,29 +794,23 @@ class TestFingerprintManager(unittest.TestCase):
 
     def test_register_verify_identify(self):
         """Test fingerprint registration, verification, and identification."""
-        with mock.patch('improved_fingerprint_tool.zkfinger', zkf):
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
             # Initialize manager
             manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
 
-            # Setup mock to return specific templates
+            # Setup mock to return the current user's template (user3 if unknown)
             def mock_acquire_fingerprint(message):
-                if "user1" in getattr(manager, '_current_test_user', ''):
-                    return (b'', self.sample_templates["user1"])
-                elif "user2" in getattr(manager, '_current_test_user', ''):
-                    return (b'', self.sample_templates["user2"])
-                else:
-                    return (b'', self.sample_templates["user3"])
+                return (b'', self.sample_templates.get(manager._current_test_user,
+                                                       self.sample_templates["user3"]))
 
             manager._acquire_fingerprint = mock_acquire_fingerprint
 
-            # Test registration
-            manager._current_test_user = "user1"
-            result = manager.register_fingerprint("user1", num_samples=3)
-            self.assertTrue(result)
-
-            manager._current_test_user = "user2"
-            result = manager.register_fingerprint("user2", num_samples=3)
-            self.assertTrue(result)
+            # Test registration; each user is registered once and reused below
+            for name in ("user1", "user2"):
+                with self.subTest(register=name):
+                    manager._current_test_user = name
+                    result = manager.register_fingerprint(name, num_samples=3)
+                    self.assertTrue(result)
 
             # Test verification
             manager._current_test_user = "user1"
@@ -527,7 +837,7 @@ class TestFingerprintManager(unittest.TestCase):
 
     def test_user_management(self):
         """Test user management operations."""
-        with mock.patch('improved_fingerprint_tool.zkfinger', zkf):
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
             # Initialize manager
             manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
 
@@ -557,6 +867,155 @@ class TestFingerprintManager(unittest.TestCase):
             # Clean up
             manager.cleanup()
 
+    def test_acquire_timeout(self):
+        """The manager leaves polling to the device and passes its errors on."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
+            self.addCleanup(manager.cleanup)
+
+            error = zkf.ZKFingerError("Failed to capture fingerprint after maximum retries",
+                                      zkf.ZKFP_ERR_CAPTURE)
+            with mock.patch.object(manager.device, 'acquire_fingerprint', side_effect=error) as acquire:
+                with self.assertRaises(zkf.ZKFingerError) as cm:
+                    manager._acquire_fingerprint()
+            self.assertEqual(cm.exception.error_code, zkf.ZKFP_ERR_CAPTURE)
+            acquire.assert_called_once()
+            self.assertEqual(acquire.call_args.kwargs["timeout"], fingerprint_tool.MAX_ACQ_SECONDS)
+
+    def test_register_single_sample(self):
+        """A single sample is stored as captured, without a merge."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
+            self.addCleanup(manager.cleanup)
+            manager._acquire_fingerprint = lambda message: (b'', self.sample_templates["user2"])
+
+            def no_merge(*args):
+                self.fail("DBMerge called for a single sample")
+
+            self.mock_sdk.lib.ZKFPM_DBMerge = no_merge
+            self.assertTrue(manager.register_fingerprint("user2", num_samples=1))
+            stored = manager.conn.execute("SELECT fingerprint FROM users WHERE name = ?", ("user2",)).fetchone()[0]
+            self.assertEqual(stored, self.sample_templates["user2"])
+            self.assertTrue(manager.verify_fingerprint("user2"))
+
+            self.assertFalse(manager.register_fingerprint("user3", num_samples=0))
+            self.assertFalse(manager.user_exists("user3"))
+
+    def test_bulk_register(self):
+        """bulk_register writes all rows in one transaction, or none of them."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
+            self.addCleanup(manager.cleanup)
+
+            count = manager.bulk_register([
+                ("user1", self.sample_templates["user1"]),
+                ("user2", self.sample_templates["user2"]),
+            ])
+            self.assertEqual(count, 2)
+
+            # Load the identification caches; a bulk write drops them
+            manager._acquire_fingerprint = lambda message: (b'', self.sample_templates["user2"])
+            self.assertEqual(manager.identify_fingerprint(), "user2")
+            self.assertTrue(manager._identify_caches)
+
+            # Existing names are replaced
+            manager.bulk_register([("user1", self.sample_templates["user3"])])
+            self.assertFalse(manager._identify_caches)
+            self.assertEqual([user['name'] for user in manager.list_users()], ["user1", "user2"])
+
+            # A bad row rolls back the whole batch
+            with self.assertRaises(sqlite3.IntegrityError):
+                manager.bulk_register([("user4", self.sample_templates["user1"]), ("user5", None)])
+            self.assertFalse(manager.user_exists("user4"))
+
+            manager._acquire_fingerprint = lambda message: (b'', self.sample_templates["user3"])
+            self.assertEqual(manager.identify_fingerprint(), "user1")
+
+    def test_external_delete_not_hidden(self):
+        """A local change does not mark another process's changes as loaded."""
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.unlink, db_path)
+
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=db_path)
+            self.addCleanup(manager.cleanup)
+            probe = self.sample_templates["user1"]
+            manager._acquire_fingerprint = lambda message: (b'', probe)
+
+            self.assertTrue(manager.register_fingerprint("user1", num_samples=1))
+            self.assertEqual(manager.identify_fingerprint(), "user1")
+
+            # Another process deletes user1 while the caches are loaded
+            other = sqlite3.connect(db_path)
+            with other:
+                other.execute("DELETE FROM users WHERE name = ?", ("user1",))
+            other.close()
+
+            probe = self.sample_templates["user2"]
+            self.assertTrue(manager.register_fingerprint("user2", num_samples=1))
+            self.assertEqual([user['name'] for user in manager.list_users()], ["user2"])
+
+            probe = self.sample_templates["user1"]
+            self.assertNotEqual(manager.identify_fingerprint(), "user1")
+
+    def test_identify_sdk_error(self):
+        """SDK search failures are raised, not reported as no match."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
+            self.addCleanup(manager.cleanup)
+            manager.bulk_register([("user1", self.sample_templates["user1"]),
+                                   ("user3", self.sample_templates["user3"])])
+            manager._acquire_fingerprint = lambda message: (b'', self.sample_templates["user2"])
+
+            # No candidate is a plain miss, in one shard or several
+            self.assertIsNone(manager.identify_fingerprint())
+            self.assertIsNone(manager.identify_fingerprint(num_threads=2))
+
+            failure = zkf.ZKFingerError("Template identification failed", zkf.ZKFP_ERR_INVALIDHANDLE)
+            with mock.patch.object(self.mock_sdk, 'db_identify', side_effect=failure):
+                with self.assertRaises(zkf.ZKFingerError):
+                    manager.identify_fingerprint()
+                with self.assertRaises(zkf.ZKFingerError):
+                    manager.identify_fingerprint(num_threads=2)
+
+    def test_threshold_before_open(self):
+        """Without a scanner the threshold is kept and written by open_device()."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path, open_device=False)
+            self.addCleanup(manager.cleanup)
+            self.assertTrue(manager.set_threshold(70))
+            self.assertEqual(manager.match_threshold, 70)
+
+            with mock.patch.object(MockDevice, 'set_parameter', autospec=True,
+                                   return_value=True) as set_parameter:
+                manager.open_device()
+            self.assertIn(mock.call(manager.device, zkf.FP_THRESHOLD_CODE, 70),
+                          set_parameter.call_args_list)
+
+    def test_iter_users(self):
+        """iter_users pages through users in name order."""
+        with mock.patch('fingerprint_tool.zkfinger', zkf):
+            manager = FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
+            self.addCleanup(manager.cleanup)
+
+            names = [f"user{i}" for i in range(5)]
+            manager.bulk_register([(name, self.sample_templates["user1"]) for name in reversed(names)])
+
+            def page(**kwargs):
+                return [user['name'] for user in manager.iter_users(**kwargs)]
+
+            self.assertEqual(page(), names)
+            self.assertEqual(page(batch_size=2), names)
+            self.assertEqual(page(limit=2), names[:2])
+            self.assertEqual(page(limit=2, offset=1), names[1:3])
+            self.assertEqual(page(offset=3), names[3:])
+            self.assertEqual(page(limit=0), [])
+            self.assertEqual(manager.list_users(limit=1, offset=4)[0]['name'], "user4")
+
+            user = next(manager.iter_users())
+            self.assertEqual(set(user), {"id", "name", "date_added"})
+
 
 class TestClickCommands(unittest.TestCase):
     """Functional tests for Click commands."""
@@ -566,47 +1025,64 @@ class TestClickCommands(unittest.TestCase):
         # Create a mock SDK
         self.mock_sdk = MockSDK()
 
-        # Create a temporary database
-        self.db_fd, self.db_path = tempfile.mkstemp()
-        os.close(self.db_fd)
+        # File database: each command cleans up the manager, closing its
+        # connection, and the tests read the data back afterwards
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.unlink, self.db_path)
+
+        # Make zkf.ZKFingerSDK return our mock
+        _sdk_class.return_value = self.mock_sdk
 
-        # Mock the zkf.ZKFingerSDK class
-        self.sdk_patcher = mock.patch('zkfinger_enhanced.ZKFingerSDK', return_value=self.mock_sdk)
-        self.addCleanup(self.sdk_patcher.stop)
-        self.sdk_patcher.start()
+        # Mock click functions; echo only needs to record what was printed
+        self.echo_calls = []
 
-        # Mock click functions
-        self.click_echo_patcher = mock.patch('click.echo')
-        self.mock_click_echo = self.click_echo_patcher.start()
+        def record_echo(message=None, *args, **kwargs):
+            self.echo_calls.append(message)
+
+        self.click_echo_patcher = mock.patch('click.echo', new=record_echo)
+        self.click_echo_patcher.start()
         self.addCleanup(self.click_echo_patcher.stop)
 
         self.click_confirm_patcher = mock.patch('click.confirm', return_value=True)
         self.click_confirm_patcher.start()
         self.addCleanup(self.click_confirm_patcher.stop)
+        self.sleep_patcher = mock.patch('time.sleep')
+        self.sleep_patcher.start()
+        self.addCleanup(self.sleep_patcher.stop)
 
         # Import click commands after patching
-        import improved_fingerprint_tool
-        self.cmds = improved_fingerprint_tool
+        import fingerprint_tool
+        self.cmds = fingerprint_tool
 
         # Prepare a fingerprint manager for testing
         self.manager = self.cmds.FingerprintManager(lib_path="dummy.so", db_path=self.db_path)
 
         # Prepare sample templates
-        self.sample_templates = {
-            "user1": b'TEMPLATE_USER1' + b'\x00' * 100,
-            "user2": b'TEMPLATE_USER2' + b'\x00' * 100,
-            "user3": b'TEMPLATE_USER3' + b'\x00' * 100,
-        }
+        self.sample_templates = SAMPLE_TEMPLATES
 
     def tearDown(self):
         """Tear down test fixtures."""
         if hasattr(self, 'manager'):
             self.manager.cleanup()
-        os.unlink(self.db_path)
+
+    def _invoke(self, *args):
+        """Run a CLI command; the patched FingerprintManager hands it self.manager."""
+        result = CliRunner().invoke(self.cmds.cli, args, catch_exceptions=False)
+        self.assertEqual(result.exit_code, 0)
+
+    def _register_test_user(self):
+        """Register "test_user" with the user1 template on the test manager."""
+        def mock_acquire_fingerprint(message):
+            return (b'', self.sample_templates["user1"])
+
+        self.manager._acquire_fingerprint = mock_acquire_fingerprint
+        # One sample: these tests only need the user to exist
+        self.assertTrue(self.manager.register_fingerprint("test_user", num_samples=1))
 
     def test_register_command(self):
         """Test the register command."""
-        with mock.patch('improved_fingerprint_tool.FingerprintManager', return_value=self.manager):
+        with mock.patch('fingerprint_tool.FingerprintManager', return_value=self.manager):
             # Setup mock to return specific templates
             def mock_acquire_fingerprint(message):
                 return (b'', self.sample_templates["user1"])
@@ -614,7 +1090,7 @@ class TestClickCommands(unittest.TestCase):
             self.manager._acquire_fingerprint = mock_acquire_fingerprint
 
             # Run register command
-            self.cmds.register(self.manager, "test_user", 3)
+            self._invoke("register", "--name", "test_user", "--samples", "3")
 
             # Verify user was registered
             users = self.manager.list_users()
@@ -623,73 +1099,314 @@ class TestClickCommands(unittest.TestCase):
 
     def test_verify_command(self):
         """Test the verify command."""
-        with mock.patch('improved_fingerprint_tool.FingerprintManager', return_value=self.manager):
-            # Setup mock to return specific templates
-            def mock_acquire_fingerprint(message):
-                return (b'', self.sample_templates["user1"])
-
-            self.manager._acquire_fingerprint = mock_acquire_fingerprint
-
+        with mock.patch('fingerprint_tool.FingerprintManager', return_value=self.manager):
             # Register a user first
-            self.manager.register_fingerprint("test_user", num_samples=3)
+            self._register_test_user()
 
             # Run verify command
-            self.cmds.verify(self.manager, "test_user")
+            self._invoke("verify", "--name", "test_user")
 
             # Check echo calls
-            self.mock_click_echo.assert_any_call(mock.ANY)  # Multiple calls, don't check specific message
+            self.assertTrue(self.echo_calls)  # Multiple calls, don't check specific message
 
     def test_identify_command(self):
         """Test the identify command."""
-        with mock.patch('improved_fingerprint_tool.FingerprintManager', return_value=self.manager):
-            # Setup mock to return specific templates
-            def mock_acquire_fingerprint(message):
-                return (b'', self.sample_templates["user1"])
-
-            self.manager._acquire_fingerprint = mock_acquire_fingerprint
-
+        with mock.patch('fingerprint_tool.FingerprintManager', return_value=self.manager):
             # Register a user first
-            self.manager.register_fingerprint("test_user", num_samples=3)
+            self._register_test_user()
 
             # Run identify command
-            self.cmds.identify(self.manager)
+            self._invoke("identify")
 
             # Check echo calls
-            self.mock_click_echo.assert_any_call(mock.ANY)  # Multiple calls, don't check specific message
+            self.assertTrue(self.echo_calls)  # Multiple calls, don't check specific message
 
     def test_list_command(self):
         """Test the list command."""
-        with mock.patch('improved_fingerprint_tool.FingerprintManager', return_value=self.manager):
+        with mock.patch('fingerprint_tool.FingerprintManager', return_value=self.manager):
             # Register a user first
-            def mock_acquire_fingerprint(message):
-                return (b'', self.sample_templates["user1"])
-
-            self.manager._acquire_fingerprint = mock_acquire_fingerprint
-            self.manager.register_fingerprint("test_user", num_samples=3)
+            self._register_test_user()
 
             # Run list command
-            self.cmds.list(self.manager)
+            self._invoke("list")
 
             # Check echo calls
-            self.mock_click_echo.assert_any_call(mock.ANY)  # Multiple calls, don't check specific message
+            self.assertTrue(self.echo_calls)  # Multiple calls, don't check specific message
 
     def test_delete_command(self):
         """Test the delete command."""
-        with mock.patch('improved_fingerprint_tool.FingerprintManager', return_value=self.manager):
+        with mock.patch('fingerprint_tool.FingerprintManager', return_value=self.manager):
             # Register a user first
-            def mock_acquire_fingerprint(message):
-                return (b'', self.sample_templates["user1"])
-
-            self.manager._acquire_fingerprint = mock_acquire_fingerprint
-            self.manager.register_fingerprint("test_user", num_samples=3)
+            self._register_test_user()
 
             # Run delete command
-            self.cmds.delete(self.manager, "test_user")
+            self._invoke("delete", "--name", "test_user")
 
             # Verify user was deleted
             users = self.manager.list_users()
             self.assertEqual(len(users), 0)
 
 
+class TestFingerprintAPI(unittest.TestCase):
+    """Functional tests for the fingerprint_api CLI."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.addCleanup(os.unlink, self.db_path)
+
+        # Database-only commands never open the scanner
+        manager = FingerprintManager(db_path=self.db_path, open_device=False)
+        manager.bulk_register([(name, template) for name, template in SAMPLE_TEMPLATES.items()])
+        manager.cleanup()
+
+        # Make zkf.ZKFingerSDK return a mock for commands that open the scanner
+        self.mock_sdk = MockSDK()
+        _sdk_class.return_value = self.mock_sdk
+
+    def _invoke(self, *args):
+        """Run the API CLI in-process and return its output."""
+        result = CliRunner().invoke(fingerprint_api.cli, ["--db-path", self.db_path] + [*args],
+                                    catch_exceptions=False)
+        self.assertEqual(result.exit_code, 0)
+        return result.output
+
+    def test_list_json(self):
+        """The streamed JSON document has the list_users fields."""
+        result = json.loads(self._invoke("list"))
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["count"], 3)
+        self.assertEqual([user["name"] for user in result["users"]], ["user1", "user2", "user3"])
+
+        result = json.loads(self._invoke("list", "--limit", "1", "--offset", "2"))
+        self.assertEqual([user["name"] for user in result["users"]], ["user3"])
+        self.assertEqual(result["count"], 1)
+
+        result = json.loads(self._invoke("list", "--offset", "3"))
+        self.assertEqual((result["users"], result["count"]), ([], 0))
+
+    def test_list_text(self):
+        """Text output uses the same layout as a rendered list_users() result."""
+        lines = self._invoke("--no-json", "list").splitlines()
+        self.assertEqual(lines[0], "Found 3 registered users:")
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith("- user1 (ID: "))
+
+    def test_register_never_prompts(self):
+        """register runs without a terminal, as it does under `serve`."""
+        with mock.patch('click.confirm', side_effect=AssertionError("prompted")), \
+                mock.patch('time.sleep'):
+            result = json.loads(self._invoke("--ndjson", "register", "--name", "user4").splitlines()[-1])
+            self.assertEqual(result["status"], "success")
+            self.assertEqual(result["user"]["samples"], 3)
+
+            result = json.loads(self._invoke("--ndjson", "register", "--name", "user1").splitlines()[-1])
+            self.assertTrue(result["user"]["overwritten"])
+
+            result = json.loads(self._invoke("--ndjson", "register", "--name", "user1",
+                                             "--no-overwrite").splitlines()[-1])
+            self.assertEqual(result["error_type"], "user_exists")
+
+    def test_list_database_error(self):
+        """Every output mode exits with status 1 when listing fails."""
+        def failing_rows(*args, **kwargs):
+            raise sqlite3.OperationalError("disk I/O error")
+            yield
+
+        with mock.patch.object(FingerprintManager, 'iter_users', side_effect=failing_rows):
+            for mode in ("--json", "--no-json", "--ndjson"):
+                with self.subTest(mode=mode):
+                    result = CliRunner().invoke(fingerprint_api.cli,
+                                                ["--db-path", self.db_path, mode, "list"])
+                    self.assertEqual(result.exit_code, 1)
+                    self.assertIn("disk I/O error", result.output)
+
+    def test_list_ndjson(self):
+        """--ndjson writes one user object per line."""
+        lines = self._invoke("--ndjson", "list").splitlines()
+        users = [json.loads(line) for line in lines]
+        self.assertEqual([user["name"] for user in users], ["user1", "user2", "user3"])
+        self.assertEqual(set(users[0]), {"id", "name", "date_added"})
+
+        lines = self._invoke("--ndjson", "list", "--limit", "2").splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_threshold_needs_device(self):
+        """Setting the threshold opens the scanner and writes the device parameter."""
+        with mock.patch.object(MockDevice, 'set_parameter', autospec=True,
+                               return_value=True) as set_parameter:
+            with fingerprint_api.FingerprintAPI(db_path=self.db_path) as api:
+                result = api.set_threshold(70)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(set_parameter.call_args.args[1:], (zkf.FP_THRESHOLD_CODE, 70))
+
+        _sdk_class.side_effect = zkf.ZKFingerError("No library")
+        self.addCleanup(setattr, _sdk_class, 'side_effect', None)
+        with fingerprint_api.FingerprintAPI(db_path=self.db_path) as api:
+            result = api.set_threshold(70)
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["code"], fingerprint_api.ERROR_CODES["INITIALIZATION_ERROR"])
+
+    def test_info_counts_users(self):
+        """info reports the user count without loading the users."""
+        with mock.patch.object(FingerprintManager, 'list_users', side_effect=AssertionError):
+            with fingerprint_api.FingerprintAPI(db_path=self.db_path) as api:
+                result = api.get_info()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["system_info"]["user_count"], 3)
+        self.assertEqual(result["system_info"]["device"], {"width": 300, "height": 400, "dpi": 500})
+
+    def test_flush_without_libc(self):
+        """Output can be silenced where the C library cannot be loaded."""
+        fingerprint_api._libc.cache_clear()
+        self.addCleanup(fingerprint_api._libc.cache_clear)
+        with mock.patch('os.name', 'nt'):
+            self.assertIsNone(fingerprint_api._libc())
+            with fingerprint_api.FingerprintAPI(db_path=self.db_path) as api:
+                with api._silence_fds():
+                    pass
+
+    def test_delete_ndjson(self):
+        """Other commands print their response as one compact line."""
+        # Under CliRunner the manager's own messages are not silenced (they
+        # are only hidden at the file descriptor level); the response is last
+        response = self._invoke("--ndjson", "delete", "--name", "user2").splitlines()[-1]
+        self.assertNotIn("\n", response)
+        self.assertEqual(json.loads(response)["status"], "success")
+        self.assertEqual(json.loads(self._invoke("list"))["count"], 2)
+
+
+class TestDaemon(unittest.TestCase):
+    """Tests for forwarding commands to a `serve` process."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.db_path = os.path.join(self.tmpdir.name, "fingerprints.db")
+        self.socket_path = os.path.join(self.tmpdir.name, "api.sock")
+
+        manager = FingerprintManager(db_path=self.db_path, open_device=False)
+        manager.bulk_register([(name, template) for name, template in SAMPLE_TEMPLATES.items()])
+        manager.cleanup()
+
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(self.server.close)
+        self.server.bind(self.socket_path)
+        self.server.listen()
+
+    def _serve_once(self, handler=None):
+        """Accept one connection in the background and answer it with handler."""
+        api = fingerprint_api.FingerprintAPI(db_path=self.db_path)
+        handler = handler or (lambda conn: fingerprint_api._handle_daemon_connection(api, conn))
+
+        def serve():
+            conn, _ = self.server.accept()
+            handler(conn)
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(api.cleanup)
+
+    def _request(self, op, params, db_path=None):
+        return fingerprint_api._daemon_request(self.socket_path, op, params,
+                                               "libzkfp.so", db_path or self.db_path)
+
+    def test_round_trip(self):
+        """A forwarded request is answered by the daemon's API."""
+        self._serve_once()
+        result = self._request("list", {"limit": 2, "offset": 0})
+        self.assertEqual(result["status"], "success")
+        self.assertEqual([user["name"] for user in result["users"]], ["user1", "user2"])
+
+    def test_database_mismatch_refused(self):
+        """The daemon refuses requests for a database it does not serve."""
+        self._serve_once()
+        result = self._request("list", {}, db_path=os.path.join(self.tmpdir.name, "other.db"))
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(result["code"], fingerprint_api.ERROR_CODES["INVALID_INPUT"])
+
+    def test_other_user_refused(self):
+        """The daemon answers other users with a permission error."""
+        self._serve_once()
+        # The client sees the daemon's own uid; the daemon sees a stranger
+        def peer_uid(sock):
+            in_daemon = threading.current_thread() is not threading.main_thread()
+            return os.getuid() + 1 if in_daemon else os.getuid()
+
+        with mock.patch.object(fingerprint_api, '_peer_uid', side_effect=peer_uid):
+            result = self._request("list", {})
+        self.assertEqual(result["code"], fingerprint_api.ERROR_CODES["PERMISSION_ERROR"])
+
+    def test_foreign_daemon_skipped(self):
+        """A socket served by another user is not used."""
+        self._serve_once(handler=lambda conn: conn.close())
+        with mock.patch.object(fingerprint_api, '_peer_uid', return_value=os.getuid() + 1):
+            self.assertIsNone(self._request("list", {}))
+
+    def test_invalid_reply_is_an_error(self):
+        """An undecodable reply is an error; the operation is not run again."""
+        def reply(conn):
+            with conn:
+                conn.recv(65536)
+                conn.sendall(b"not json\n")
+
+        self._serve_once(handler=reply)
+        result = self._request("delete", {"name": "user1"})
+        self.assertEqual(result["code"], fingerprint_api.ERROR_CODES["UNKNOWN_ERROR"])
+
+    def test_stalled_client_times_out(self):
+        """A client that never sends its request does not block the daemon."""
+        api = fingerprint_api.FingerprintAPI(db_path=self.db_path)
+        self.addCleanup(api.cleanup)
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(client.close)
+        client.connect(self.socket_path)
+        conn, _ = self.server.accept()
+
+        with mock.patch.object(fingerprint_api, 'DAEMON_REQUEST_TIMEOUT', 0.05):
+            fingerprint_api._handle_daemon_connection(api, conn)
+        reply = json.loads(client.makefile('rb').readline())
+        self.assertEqual(reply["code"], fingerprint_api.ERROR_CODES["INVALID_INPUT"])
+
+    def test_client_reset_handled(self):
+        """A read error on the connection is logged, not raised."""
+        api = fingerprint_api.FingerprintAPI(db_path=self.db_path)
+        self.addCleanup(api.cleanup)
+        conn = mock.MagicMock()
+        reader = conn.makefile.return_value.__enter__.return_value
+        reader.readline.side_effect = ConnectionResetError()
+        fingerprint_api._handle_daemon_connection(api, conn)
+        conn.sendall.assert_not_called()
+
+    def test_forwarding_is_opt_in(self):
+        """Commands only consult the daemon with --use-daemon or --socket."""
+        refused = {"status": "error", "code": 1, "message": "from daemon", "error_type": "x"}
+        env = {"XDG_RUNTIME_DIR": self.tmpdir.name}
+        def daemon_request(socket_path, *args):
+            return refused if socket_path else None
+
+        with mock.patch.object(fingerprint_api, '_daemon_request', side_effect=daemon_request) as request:
+            result = CliRunner().invoke(fingerprint_api.cli, ["--db-path", self.db_path, "list"], env=env)
+            self.assertEqual(json.loads(result.output)["count"], 3)
+            self.assertIsNone(request.call_args.args[0])
+
+            result = CliRunner().invoke(fingerprint_api.cli,
+                                        ["--db-path", self.db_path, "--use-daemon", "list"], env=env)
+            self.assertEqual(json.loads(result.output)["message"], "from daemon")
+            self.assertEqual(request.call_args.args[0],
+                             os.path.join(self.tmpdir.name, "fingerprint_api", "api.sock"))
+
+    def test_socket_dir_must_be_private(self):
+        """serve refuses a default socket directory others can enter."""
+        directory = os.path.join(self.tmpdir.name, "fingerprint_api")
+        self.assertIsNone(fingerprint_api._check_socket_dir(directory))
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+        os.chmod(directory, 0o755)
+        self.assertIsNotNone(fingerprint_api._check_socket_dir(directory))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -41,12 +41,14 @@ Author: Araray
 Date: 2025-03-02
 """
 
+import contextlib
 import ctypes
 import platform
 import threading
 import time
 import logging
-from typing import Tuple
+from functools import cached_property
+from typing import Dict, Tuple
 
 
 # Set up logging
@@ -69,6 +71,28 @@ ZKFP_ERR_CANCELED = -18     # Capture canceled
 ZKFP_ERR_VERIFY = -20       # Fingerprint comparison failed
 ZKFP_ERR_IMGPROCESS = -24   # Image processing failed
 
+# What ZKFPM_DBIdentify returns when no template in the cache scores over
+# the SDK's threshold: a miss rather than a failure
+IDENTIFY_NO_CANDIDATE = ZKFP_ERR_OTHER
+
+# Human-readable descriptions of the error codes above
+_ERROR_DESCRIPTIONS = {
+    ZKFP_ERR_OK: "Operation succeeded",
+    ZKFP_ERR_INITLIB: "Failed to initialize the algorithm library",
+    ZKFP_ERR_NODEVICE: "No device connected",
+    ZKFP_ERR_INVALIDPARAM: "Invalid parameter",
+    ZKFP_ERR_INVALIDHANDLE: "Invalid handle",
+    ZKFP_ERR_CAPTURE: "Failed to capture image",
+    ZKFP_ERR_EXTRACT: "Failed to extract fingerprint template",
+    ZKFP_ERR_ABSORT: "Suspension operation",
+    ZKFP_ERR_BUSY: "Device is busy",
+    ZKFP_ERR_DELETE: "Failed to delete fingerprint template",
+    ZKFP_ERR_OTHER: "Other operation failure",
+    ZKFP_ERR_CANCELED: "Capture canceled",
+    ZKFP_ERR_VERIFY: "Fingerprint comparison failed",
+    ZKFP_ERR_IMGPROCESS: "Image processing failed"
+}
+
 
 # Constants from libzkfptype.h
 MAX_TEMPLATE_SIZE = 2048    # Maximum length of a template
@@ -87,6 +111,105 @@ PARAM_CODE_RED_LIGHT = 103   # Red light (write-only, 1: blinks, 0: disabled)
 PARAM_CODE_BUZZER = 104     # Buzzer (write-only, 1: starts, 0: disabled)
 PARAM_CODE_FORMAT = 10001   # Template format (write-only, 0: ANSI378, 1: ISO 19794-2)
 
+# Write-only parameters whose last written value the device wrapper remembers,
+# so unchanged settings are not sent again. The buzzer is left out because
+# writing 1 starts a new beep each time.
+_CACHED_WRITE_PARAMS = frozenset({
+    PARAM_CODE_WHITE_LIGHT,
+    PARAM_CODE_GREEN_LIGHT,
+    PARAM_CODE_RED_LIGHT,
+    PARAM_CODE_FORMAT,
+})
+
+
+# Capture polling
+ACQ_BACKOFF_START = 0.02    # First delay (seconds) between capture attempts
+
+# Seconds a get_parameter result is reused (0 disables the cache)
+PARAM_CACHE_TTL = 1.0
+
+# Acquisition errors meaning the device is gone. After one, acquire_fingerprint
+# fails fast for FATAL_BACKOFF seconds (0 disables this) instead of polling again.
+_FATAL_ACQUIRE_ERRORS = frozenset({
+    ZKFP_ERR_NODEVICE,
+    ZKFP_ERR_INVALIDHANDLE,
+})
+FATAL_BACKOFF = 30.0
+
+
+# SDK function prototypes: (name, restype, argtypes)
+_UCHAR_P = ctypes.POINTER(ctypes.c_ubyte)
+_UINT_P = ctypes.POINTER(ctypes.c_uint)
+_PROTOTYPES = (
+    # Basic SDK functions
+    # int ZKFPM_Init(void);
+    ("ZKFPM_Init", ctypes.c_int, []),
+    # int ZKFPM_Terminate(void);
+    ("ZKFPM_Terminate", ctypes.c_int, []),
+    # int ZKFPM_GetDeviceCount(void);
+    ("ZKFPM_GetDeviceCount", ctypes.c_int, []),
+    # HANDLE ZKFPM_OpenDevice(int index);
+    ("ZKFPM_OpenDevice", ctypes.c_void_p, [ctypes.c_int]),
+    # int ZKFPM_CloseDevice(HANDLE hDevice);
+    ("ZKFPM_CloseDevice", ctypes.c_int, [ctypes.c_void_p]),
+    # int ZKFPM_AcquireFingerprint(HANDLE hDevice, unsigned char* fpImage, unsigned int cbFPImage,
+    #                             unsigned char* fpTemplate, unsigned int* cbTemplate);
+    ("ZKFPM_AcquireFingerprint", ctypes.c_int,
+     [ctypes.c_void_p, _UCHAR_P, ctypes.c_uint, _UCHAR_P, _UINT_P]),
+
+    # Device parameter functions
+    # int ZKFPM_SetParameters(HANDLE hDevice, int nParamCode, unsigned char* paramValue, unsigned int cbParamValue);
+    ("ZKFPM_SetParameters", ctypes.c_int,
+     [ctypes.c_void_p, ctypes.c_int, _UCHAR_P, ctypes.c_uint]),
+    # int ZKFPM_GetParameters(HANDLE hDevice, int nParamCode, unsigned char* paramValue, unsigned int* cbParamValue);
+    ("ZKFPM_GetParameters", ctypes.c_int,
+     [ctypes.c_void_p, ctypes.c_int, _UCHAR_P, _UINT_P]),
+
+    # Database functions
+    # HANDLE ZKFPM_DBInit(void);
+    ("ZKFPM_DBInit", ctypes.c_void_p, []),
+    # int ZKFPM_DBFree(HANDLE hDBCache);
+    ("ZKFPM_DBFree", ctypes.c_int, [ctypes.c_void_p]),
+    # int ZKFPM_DBMerge(HANDLE hDBCache, unsigned char* temp1, unsigned char* temp2,
+    #                   unsigned char* temp3, unsigned char* regTemp, unsigned int* cbRegTemp);
+    ("ZKFPM_DBMerge", ctypes.c_int,
+     [ctypes.c_void_p, _UCHAR_P, _UCHAR_P, _UCHAR_P, _UCHAR_P, _UINT_P]),
+    # int ZKFPM_DBAdd(HANDLE hDBCache, unsigned int tid, unsigned char* pTemplate, unsigned int cbTemplate);
+    ("ZKFPM_DBAdd", ctypes.c_int,
+     [ctypes.c_void_p, ctypes.c_uint, _UCHAR_P, ctypes.c_uint]),
+    # int ZKFPM_DBDel(HANDLE hDBCache, unsigned int tid);
+    ("ZKFPM_DBDel", ctypes.c_int, [ctypes.c_void_p, ctypes.c_uint]),
+    # int ZKFPM_DBClear(HANDLE hDBCache);
+    ("ZKFPM_DBClear", ctypes.c_int, [ctypes.c_void_p]),
+    # int ZKFPM_DBCount(HANDLE hDBCache, unsigned int* count);
+    ("ZKFPM_DBCount", ctypes.c_int, [ctypes.c_void_p, _UINT_P]),
+    # int ZKFPM_DBIdentify(HANDLE hDBCache, unsigned char* pTemplate, unsigned int cbTemplate,
+    #                      unsigned int* tid, unsigned int* score);
+    ("ZKFPM_DBIdentify", ctypes.c_int,
+     [ctypes.c_void_p, _UCHAR_P, ctypes.c_uint, _UINT_P, _UINT_P]),
+    # int ZKFPM_DBMatch(HANDLE hDBCache, unsigned char* pTemplate1, unsigned int cbTemplate1,
+    #                   unsigned char* pTemplate2, unsigned int cbTemplate2);
+    ("ZKFPM_DBMatch", ctypes.c_int,
+     [ctypes.c_void_p, _UCHAR_P, ctypes.c_uint, _UCHAR_P, ctypes.c_uint]),
+)
+
+
+# Stand-in for the SDK and device locks when thread safety is switched off
+_NULL_LOCK = contextlib.nullcontext()
+
+
+def _as_cbuf(data: bytes) -> ctypes.Array:
+    """
+    Copy bytes into a c_ubyte array in a single memcpy.
+
+    Args:
+        data: Bytes to copy (e.g. a fingerprint template).
+
+    Returns:
+        A ctypes c_ubyte array holding a copy of data.
+    """
+    return (ctypes.c_ubyte * len(data)).from_buffer_copy(data)
+
 
 class ZKFingerError(Exception):
     """Custom exception for errors raised by the ZKFinger SDK wrapper."""
@@ -110,23 +233,7 @@ class ZKFingerError(Exception):
     @staticmethod
     def _get_error_description(error_code: int) -> str:
         """Get a human-readable description of an error code."""
-        error_map = {
-            ZKFP_ERR_OK: "Operation succeeded",
-            ZKFP_ERR_INITLIB: "Failed to initialize the algorithm library",
-            ZKFP_ERR_NODEVICE: "No device connected",
-            ZKFP_ERR_INVALIDPARAM: "Invalid parameter",
-            ZKFP_ERR_INVALIDHANDLE: "Invalid handle",
-            ZKFP_ERR_CAPTURE: "Failed to capture image",
-            ZKFP_ERR_EXTRACT: "Failed to extract fingerprint template",
-            ZKFP_ERR_ABSORT: "Suspension operation",
-            ZKFP_ERR_BUSY: "Device is busy",
-            ZKFP_ERR_DELETE: "Failed to delete fingerprint template",
-            ZKFP_ERR_OTHER: "Other operation failure",
-            ZKFP_ERR_CANCELED: "Capture canceled",
-            ZKFP_ERR_VERIFY: "Fingerprint comparison failed",
-            ZKFP_ERR_IMGPROCESS: "Image processing failed"
-        }
-        return error_map.get(error_code, "Unknown error")
+        return _ERROR_DESCRIPTIONS.get(error_code, "Unknown error")
 
 
 class ZKFingerSDK:
@@ -137,21 +244,26 @@ class ZKFingerSDK:
     and open fingerprint devices. It also handles proper cleanup of resources.
     """
 
-    def __init__(self, lib_path: str = None):
+    def __init__(self, lib_path: str = None, thread_safe: bool = True):
         """
         Initialize the ZKFinger SDK.
 
         Args:
             lib_path: Optional path to the shared library file.
                      If None, a default name is chosen based on the OS.
+            thread_safe: Whether the SDK, its DB caches and its devices lock
+                        around SDK calls. Pass False only when a single
+                        thread uses this SDK instance.
 
         Raises:
             ZKFingerError: If the shared library cannot be loaded or if initialization fails.
         """
-        self._lock = threading.RLock()  # For thread safety
+        self._thread_safe = thread_safe
+        self._lock = threading.RLock() if thread_safe else _NULL_LOCK
         self._initialized = False
-        self._open_devices = []
-        self._open_db_caches = []
+        self._open_devices = set()
+        self._open_db_caches = {}  # DBInit handle (an int) -> per-cache lock
+        self._tls = threading.local()  # Per-thread out-parameters, see _out_params
 
         # Determine default library name based on the operating system
         if lib_path is None:
@@ -186,138 +298,21 @@ class ZKFingerSDK:
 
     def _setup_functions(self):
         """Set up the function prototypes for the SDK functions."""
-        # Basic SDK functions
-        self._setup_basic_functions()
-
-        # Device parameter functions
-        self._setup_parameter_functions()
-
-        # Database functions
-        self._setup_database_functions()
-
-    def _setup_basic_functions(self):
-        """Set up basic SDK function prototypes."""
-        # int ZKFPM_Init(void);
-        self.lib.ZKFPM_Init.restype = ctypes.c_int
-        self.lib.ZKFPM_Init.argtypes = []
-
-        # int ZKFPM_Terminate(void);
-        self.lib.ZKFPM_Terminate.restype = ctypes.c_int
-        self.lib.ZKFPM_Terminate.argtypes = []
-
-        # int ZKFPM_GetDeviceCount(void);
-        self.lib.ZKFPM_GetDeviceCount.restype = ctypes.c_int
-        self.lib.ZKFPM_GetDeviceCount.argtypes = []
-
-        # HANDLE ZKFPM_OpenDevice(int index);
-        self.lib.ZKFPM_OpenDevice.restype = ctypes.c_void_p
-        self.lib.ZKFPM_OpenDevice.argtypes = [ctypes.c_int]
-
-        # int ZKFPM_CloseDevice(HANDLE hDevice);
-        self.lib.ZKFPM_CloseDevice.restype = ctypes.c_int
-        self.lib.ZKFPM_CloseDevice.argtypes = [ctypes.c_void_p]
-
-        # int ZKFPM_AcquireFingerprint(HANDLE hDevice, unsigned char* fpImage, unsigned int cbFPImage,
-        #                             unsigned char* fpTemplate, unsigned int* cbTemplate);
-        self.lib.ZKFPM_AcquireFingerprint.restype = ctypes.c_int
-        self.lib.ZKFPM_AcquireFingerprint.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_uint)
-        ]
-
-    def _setup_parameter_functions(self):
-        """Set up parameter-related function prototypes."""
-        # int ZKFPM_SetParameters(HANDLE hDevice, int nParamCode, unsigned char* paramValue, unsigned int cbParamValue);
-        self.lib.ZKFPM_SetParameters.restype = ctypes.c_int
-        self.lib.ZKFPM_SetParameters.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint
-        ]
-
-        # int ZKFPM_GetParameters(HANDLE hDevice, int nParamCode, unsigned char* paramValue, unsigned int* cbParamValue);
-        self.lib.ZKFPM_GetParameters.restype = ctypes.c_int
-        self.lib.ZKFPM_GetParameters.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_int,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_uint)
-        ]
-
-    def _setup_database_functions(self):
-        """Set up database-related function prototypes."""
-        # HANDLE ZKFPM_DBInit(void);
-        self.lib.ZKFPM_DBInit.restype = ctypes.c_void_p
-        self.lib.ZKFPM_DBInit.argtypes = []
-
-        # int ZKFPM_DBFree(HANDLE hDBCache);
-        self.lib.ZKFPM_DBFree.restype = ctypes.c_int
-        self.lib.ZKFPM_DBFree.argtypes = [ctypes.c_void_p]
-
-        # int ZKFPM_DBMerge(HANDLE hDBCache, unsigned char* temp1, unsigned char* temp2,
-        #                   unsigned char* temp3, unsigned char* regTemp, unsigned int* cbRegTemp);
-        self.lib.ZKFPM_DBMerge.restype = ctypes.c_int
-        self.lib.ZKFPM_DBMerge.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.POINTER(ctypes.c_uint)
-        ]
-
-        # int ZKFPM_DBAdd(HANDLE hDBCache, unsigned int tid, unsigned char* pTemplate, unsigned int cbTemplate);
-        self.lib.ZKFPM_DBAdd.restype = ctypes.c_int
-        self.lib.ZKFPM_DBAdd.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_uint,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint
-        ]
-
-        # int ZKFPM_DBDel(HANDLE hDBCache, unsigned int tid);
-        self.lib.ZKFPM_DBDel.restype = ctypes.c_int
-        self.lib.ZKFPM_DBDel.argtypes = [
-            ctypes.c_void_p,
-            ctypes.c_uint
-        ]
-
-        # int ZKFPM_DBClear(HANDLE hDBCache);
-        self.lib.ZKFPM_DBClear.restype = ctypes.c_int
-        self.lib.ZKFPM_DBClear.argtypes = [ctypes.c_void_p]
-
-        # int ZKFPM_DBCount(HANDLE hDBCache, unsigned int* count);
-        self.lib.ZKFPM_DBCount.restype = ctypes.c_int
-        self.lib.ZKFPM_DBCount.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_uint)
-        ]
-
-        # int ZKFPM_DBIdentify(HANDLE hDBCache, unsigned char* pTemplate, unsigned int cbTemplate,
-        #                      unsigned int* tid, unsigned int* score);
-        self.lib.ZKFPM_DBIdentify.restype = ctypes.c_int
-        self.lib.ZKFPM_DBIdentify.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint,
-            ctypes.POINTER(ctypes.c_uint),
-            ctypes.POINTER(ctypes.c_uint)
-        ]
-
-        # int ZKFPM_DBMatch(HANDLE hDBCache, unsigned char* pTemplate1, unsigned int cbTemplate1,
-        #                   unsigned char* pTemplate2, unsigned int cbTemplate2);
-        self.lib.ZKFPM_DBMatch.restype = ctypes.c_int
-        self.lib.ZKFPM_DBMatch.argtypes = [
-            ctypes.c_void_p,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint,
-            ctypes.POINTER(ctypes.c_ubyte),
-            ctypes.c_uint
-        ]
+        for name, restype, argtypes in _PROTOTYPES:
+            func = getattr(self.lib, name)
+            func.restype = restype
+            func.argtypes = argtypes
+
+        # Bound once so per-call wrappers skip the CDLL attribute lookup
+        self._c_acquire = self.lib.ZKFPM_AcquireFingerprint
+        self._c_set_parameters = self.lib.ZKFPM_SetParameters
+        self._c_get_parameters = self.lib.ZKFPM_GetParameters
+        self._c_dbmatch = self.lib.ZKFPM_DBMatch
+        self._c_dbidentify = self.lib.ZKFPM_DBIdentify
+        self._c_dbadd = self.lib.ZKFPM_DBAdd
+        self._c_dbdel = self.lib.ZKFPM_DBDel
+        self._c_dbcount = self.lib.ZKFPM_DBCount
+        self._c_dbmerge = self.lib.ZKFPM_DBMerge
 
     def __del__(self):
         """Destructor: Terminates the SDK when the object is garbage-collected."""
@@ -405,7 +400,7 @@ class ZKFingerSDK:
                 raise ZKFingerError(error_msg, ZKFP_ERR_NODEVICE)
 
             device = FingerprintDevice(self, handle, index)
-            self._open_devices.append(device)
+            self._open_devices.add(device)
             logger.info(f"Opened device at index {index}")
             return device
 
@@ -429,7 +424,7 @@ class ZKFingerSDK:
                 logger.error(error_msg)
                 raise ZKFingerError(error_msg)
 
-            self._open_db_caches.append(db_cache)
+            self._open_db_caches[db_cache] = threading.Lock() if self._thread_safe else _NULL_LOCK
             logger.debug("Initialized new DB cache")
             return db_cache
 
@@ -447,15 +442,59 @@ class ZKFingerSDK:
             if not self._initialized:
                 raise ZKFingerError("SDK not initialized")
 
-            if db_cache in self._open_db_caches:
+            cache_lock = self._open_db_caches.pop(db_cache, None)
+
+        if cache_lock is not None:
+            # Wait for calls still running on this cache before freeing it
+            with cache_lock:
                 ret = self.lib.ZKFPM_DBFree(db_cache)
-                if ret != ZKFP_ERR_OK:
-                    error_msg = "Failed to free DB cache"
-                    logger.error(f"{error_msg}: {ret}")
-                    raise ZKFingerError(error_msg, ret)
 
-                self._open_db_caches.remove(db_cache)
-                logger.debug("Freed DB cache")
+            if ret != ZKFP_ERR_OK:
+                with self._lock:
+                    self._open_db_caches[db_cache] = cache_lock
+                error_msg = "Failed to free DB cache"
+                logger.error(f"{error_msg}: {ret}")
+                raise ZKFingerError(error_msg, ret)
+
+            logger.debug("Freed DB cache")
+
+    def _out_params(self) -> Tuple[ctypes.c_uint, ctypes.c_uint, object, object]:
+        """
+        Get this thread's reusable unsigned int out-parameters.
+
+        DB calls on different caches run concurrently, so the values are kept
+        per thread; each caller reads them before making its next SDK call.
+
+        Returns:
+            Tuple of (first, second, byref(first), byref(second)).
+        """
+        try:
+            return self._tls.out_params
+        except AttributeError:
+            first = ctypes.c_uint(0)
+            second = ctypes.c_uint(0)
+            self._tls.out_params = (first, second, ctypes.byref(first), ctypes.byref(second))
+            return self._tls.out_params
+
+    def _db_cache_lock(self, db_cache: ctypes.c_void_p):
+        """
+        Get the lock that serializes SDK calls on one DB cache.
+
+        Args:
+            db_cache: DB cache handle.
+
+        Returns:
+            The cache's own lock, or the SDK lock for handles not created by
+            init_db_cache.
+
+        Raises:
+            ZKFingerError: If the SDK is not initialized.
+        """
+        with self._lock:
+            if not self._initialized:
+                raise ZKFingerError("SDK not initialized")
+
+            return self._open_db_caches.get(db_cache, self._lock)
 
     def db_match(self, db_cache: ctypes.c_void_p, template1: bytes, template2: bytes) -> int:
         """
@@ -472,29 +511,28 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If matching the templates fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
-            # Convert templates to C types
-            c_template1 = (ctypes.c_ubyte * len(template1))(*template1)
-            c_template2 = (ctypes.c_ubyte * len(template2))(*template2)
+        c_template1 = _as_cbuf(template1)
+        c_template2 = _as_cbuf(template2)
 
-            score = self.lib.ZKFPM_DBMatch(
+        # Holds the cache's own lock, like the other DB calls, so the cache
+        # cannot be freed while the match is running
+        with self._db_cache_lock(db_cache):
+            score = self._c_dbmatch(
                 db_cache,
-                ctypes.cast(c_template1, ctypes.POINTER(ctypes.c_ubyte)),
+                c_template1,
                 len(template1),
-                ctypes.cast(c_template2, ctypes.POINTER(ctypes.c_ubyte)),
+                c_template2,
                 len(template2)
             )
 
-            if score < 0:
-                error_msg = "Template matching failed"
-                logger.error(f"{error_msg}: {score}")
-                raise ZKFingerError(error_msg, score)
+        if score < 0:
+            error_msg = "Template matching failed"
+            logger.error(f"{error_msg}: {score}")
+            raise ZKFingerError(error_msg, score)
 
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Match score: {score}")
-            return score
+        return score
 
     def db_identify(self, db_cache: ctypes.c_void_p, template: bytes) -> Tuple[int, int]:
         """
@@ -508,34 +546,41 @@ class ZKFingerSDK:
             Tuple of (template_id, match_score).
 
         Raises:
-            ZKFingerError: If the identification fails.
+            ZKFingerError: If the identification fails; error_code is
+                IDENTIFY_NO_CANDIDATE when nothing in the cache matched.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
-            # Convert template to C type
-            c_template = (ctypes.c_ubyte * len(template))(*template)
-            c_tid = ctypes.c_uint(0)
-            c_score = ctypes.c_uint(0)
-
-            ret = self.lib.ZKFPM_DBIdentify(
+        # The search holds only this cache's lock, not the SDK lock; this lets
+        # callers identify against several caches in parallel (ctypes releases
+        # the GIL for the duration of the call)
+        c_template = _as_cbuf(template)
+        c_tid, c_score, tid_ref, score_ref = self._out_params()
+        c_tid.value = 0
+        c_score.value = 0
+
+        with self._db_cache_lock(db_cache):
+            ret = self._c_dbidentify(
                 db_cache,
-                ctypes.cast(c_template, ctypes.POINTER(ctypes.c_ubyte)),
+                c_template,
                 len(template),
-                ctypes.byref(c_tid),
-                ctypes.byref(c_score)
+                tid_ref,
+                score_ref
             )
 
-            if ret != ZKFP_ERR_OK:
-                error_msg = "Template identification failed"
-                logger.error(f"{error_msg}: {ret}")
-                raise ZKFingerError(error_msg, ret)
-
-            tid = c_tid.value
-            score = c_score.value
+        if ret == IDENTIFY_NO_CANDIDATE:
+            # Common when identifying against several shards; not an error
+            error_msg = "No identification candidate"
+            logger.debug(error_msg)
+            raise ZKFingerError(error_msg, ret)
+        elif ret != ZKFP_ERR_OK:
+            error_msg = "Template identification failed"
+            logger.error(f"{error_msg}: {ret}")
+            raise ZKFingerError(error_msg, ret)
+
+        tid = c_tid.value
+        score = c_score.value
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Identified template with ID {tid} (score: {score})")
-            return tid, score
+        return tid, score
 
     def db_add(self, db_cache: ctypes.c_void_p, tid: int, template: bytes) -> bool:
         """
@@ -552,17 +597,15 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If adding the template fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
+        # Calls on one cache are serialized by its own lock, not the SDK lock
+        with self._db_cache_lock(db_cache):
             # Convert template to C type
-            c_template = (ctypes.c_ubyte * len(template))(*template)
+            c_template = _as_cbuf(template)
 
-            ret = self.lib.ZKFPM_DBAdd(
+            ret = self._c_dbadd(
                 db_cache,
                 tid,
-                ctypes.cast(c_template, ctypes.POINTER(ctypes.c_ubyte)),
+                c_template,
                 len(template)
             )
 
@@ -571,7 +614,8 @@ class ZKFingerSDK:
                 logger.error(f"{error_msg}: {ret}")
                 raise ZKFingerError(error_msg, ret)
 
-            logger.debug(f"Added template with ID {tid}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Added template with ID {tid}")
             return True
 
     def db_delete(self, db_cache: ctypes.c_void_p, tid: int) -> bool:
@@ -588,18 +632,17 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If deleting the template fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
-            ret = self.lib.ZKFPM_DBDel(db_cache, tid)
+        # Calls on one cache are serialized by its own lock, not the SDK lock
+        with self._db_cache_lock(db_cache):
+            ret = self._c_dbdel(db_cache, tid)
 
             if ret != ZKFP_ERR_OK:
                 error_msg = f"Failed to delete template with ID {tid}"
                 logger.error(f"{error_msg}: {ret}")
                 raise ZKFingerError(error_msg, ret)
 
-            logger.debug(f"Deleted template with ID {tid}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Deleted template with ID {tid}")
             return True
 
     def db_clear(self, db_cache: ctypes.c_void_p) -> bool:
@@ -615,10 +658,8 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If clearing the DB cache fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
+        # Calls on one cache are serialized by its own lock, not the SDK lock
+        with self._db_cache_lock(db_cache):
             ret = self.lib.ZKFPM_DBClear(db_cache)
 
             if ret != ZKFP_ERR_OK:
@@ -642,13 +683,12 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If getting the template count fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
-            c_count = ctypes.c_uint(0)
+        # Calls on one cache are serialized by its own lock, not the SDK lock
+        with self._db_cache_lock(db_cache):
+            c_count, _, count_ref, _ = self._out_params()
+            c_count.value = 0
 
-            ret = self.lib.ZKFPM_DBCount(db_cache, ctypes.byref(c_count))
+            ret = self._c_dbcount(db_cache, count_ref)
 
             if ret != ZKFP_ERR_OK:
                 error_msg = "Failed to get template count"
@@ -656,7 +696,8 @@ class ZKFingerSDK:
                 raise ZKFingerError(error_msg, ret)
 
             count = c_count.value
-            logger.debug(f"DB cache contains {count} templates")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"DB cache contains {count} templates")
             return count
 
     def db_merge(self, db_cache: ctypes.c_void_p, template1: bytes, template2: bytes,
@@ -676,41 +717,42 @@ class ZKFingerSDK:
         Raises:
             ZKFingerError: If merging the templates fails.
         """
-        with self._lock:
-            if not self._initialized:
-                raise ZKFingerError("SDK not initialized")
-
-            # If template3 is not provided, use template2 again
-            if template3 is None:
-                template3 = template2
-
-            # Convert templates to C types
-            c_template1 = (ctypes.c_ubyte * len(template1))(*template1)
-            c_template2 = (ctypes.c_ubyte * len(template2))(*template2)
-            c_template3 = (ctypes.c_ubyte * len(template3))(*template3)
-
-            # Prepare merged template buffer
-            c_merged_template = (ctypes.c_ubyte * MAX_TEMPLATE_SIZE)()
-            c_merged_size = ctypes.c_uint(MAX_TEMPLATE_SIZE)
-
-            ret = self.lib.ZKFPM_DBMerge(
+        # If template3 is not provided, use template2 again
+        if template3 is None:
+            template3 = template2
+
+        # Convert templates to C types
+        c_template1 = _as_cbuf(template1)
+        c_template2 = _as_cbuf(template2)
+        c_template3 = _as_cbuf(template3)
+
+        # Prepare merged template buffer
+        c_merged_template = (ctypes.c_ubyte * MAX_TEMPLATE_SIZE)()
+        c_merged_size, _, merged_size_ref, _ = self._out_params()
+        c_merged_size.value = MAX_TEMPLATE_SIZE
+
+        # Holds the cache's own lock, like the other DB calls, so the cache
+        # cannot be freed while the merge is running
+        with self._db_cache_lock(db_cache):
+            ret = self._c_dbmerge(
                 db_cache,
-                ctypes.cast(c_template1, ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(c_template2, ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(c_template3, ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.cast(c_merged_template, ctypes.POINTER(ctypes.c_ubyte)),
-                ctypes.byref(c_merged_size)
+                c_template1,
+                c_template2,
+                c_template3,
+                c_merged_template,
+                merged_size_ref
             )
 
-            if ret != ZKFP_ERR_OK:
-                error_msg = "Template merge failed"
-                logger.error(f"{error_msg}: {ret}")
-                raise ZKFingerError(error_msg, ret)
+        if ret != ZKFP_ERR_OK:
+            error_msg = "Template merge failed"
+            logger.error(f"{error_msg}: {ret}")
+            raise ZKFingerError(error_msg, ret)
 
-            # Convert to bytes
-            merged_template = bytes(c_merged_template[:c_merged_size.value])
+        # Convert to bytes
+        merged_template = ctypes.string_at(c_merged_template, c_merged_size.value)
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug(f"Merged {len(template1)}, {len(template2)}, {len(template3)} byte templates into {len(merged_template)} byte template")
-            return merged_template
+        return merged_template
 
 
 class FingerprintDevice:
@@ -733,8 +775,23 @@ class FingerprintDevice:
         self.sdk = sdk
         self.handle = handle
         self.index = index
-        self._lock = threading.RLock()  # For thread safety
+        self._lock = threading.RLock() if sdk._thread_safe else _NULL_LOCK
         self._closed = False
+        # Scratch buffer for get/set_parameter, used under the device lock;
+        # _param_int is a c_int view over the same four bytes
+        self._param_buf = (ctypes.c_ubyte * 4)()
+        self._param_int = ctypes.c_int.from_buffer(self._param_buf)
+        self._param_size = ctypes.c_uint(0)
+        self._param_size_ref = ctypes.byref(self._param_size)
+        # Recent get_parameter results: param_code -> (value, expiry)
+        self.param_cache_ttl = PARAM_CACHE_TTL
+        self._param_cache: Dict[int, Tuple[int, float]] = {}
+        # Last value written to each of _CACHED_WRITE_PARAMS; unset until first write
+        self._param_state: Dict[int, int] = {}
+        # Last device-lost error from acquire_fingerprint and when it happened
+        self.fatal_backoff = FATAL_BACKOFF
+        self._last_fatal_ts = 0.0
+        self._last_fatal_err = None
 
         # Cache device parameters
         try:
@@ -748,10 +805,37 @@ class FingerprintDevice:
             self.height = 0
             self.image_size = 0
 
+        # Capture buffers reused by every acquire_fingerprint call; the SDK
+        # overwrites them on success, so they are not cleared between calls
+        self._image_buf = (ctypes.c_ubyte * self.image_size)()
+        self._template_buf = (ctypes.c_ubyte * MAX_TEMPLATE_SIZE)()
+        self._template_size = ctypes.c_uint(0)
+        self._template_size_ref = ctypes.byref(self._template_size)
+
     def __del__(self):
         """Destructor: Closes the device when the object is garbage-collected."""
         self.close()
 
+    @cached_property
+    def device_geometry(self) -> Dict[str, int]:
+        """
+        Image geometry of the device, queried once per opened device.
+
+        Width and height reuse the values cached when the device was opened;
+        only the DPI is read from the SDK, on first access.
+
+        Returns:
+            Dict with 'width', 'height' and 'dpi' keys.
+
+        Raises:
+            ZKFingerError: If the DPI cannot be read.
+        """
+        return {
+            "width": self.width,
+            "height": self.height,
+            "dpi": self.get_parameter(PARAM_CODE_DPI),
+        }
+
     def close(self):
         """
         Close the fingerprint device.
@@ -770,81 +854,149 @@ class FingerprintDevice:
                     raise ZKFingerError(error_msg, ret)
 
                 self._closed = True
-                if self in self.sdk._open_devices:
-                    self.sdk._open_devices.remove(self)
+                self.sdk._open_devices.discard(self)
                 logger.info(f"Closed device at index {self.index}")
                 self.handle = None
 
     def acquire_fingerprint(self, fp_image_size: int = None, fp_template_size: int = MAX_TEMPLATE_SIZE,
-                           max_retries: int = 10, retry_delay: float = 0.5) -> Tuple[bytes, bytes]:
+                           max_retries: int = 10, retry_delay: float = 0.5,
+                           timeout: float = None, copy: bool = True) -> Tuple[bytes, bytes]:
         """
         Acquire a fingerprint from the device.
 
-        This method captures both a fingerprint image and a template.
+        This method captures both a fingerprint image and a template. While no
+        finger is on the sensor it polls, starting at ACQ_BACKOFF_START seconds
+        between attempts and doubling the delay up to retry_delay.
 
         Args:
             fp_image_size: Size of the fingerprint image buffer in bytes.
                           If None, use the device's reported image size.
             fp_template_size: Size of the fingerprint template buffer in bytes.
-            max_retries: Maximum number of acquisition retries.
-            retry_delay: Delay between retries in seconds.
+            max_retries: Minimum number of acquisition attempts when no timeout is given.
+            retry_delay: Longest delay between attempts in seconds.
+            timeout: How long to keep polling for a finger, in seconds.
+                    Defaults to max_retries * retry_delay, the window the
+                    fixed-delay retries used to cover.
+            copy: If False, image_data is a read-only memoryview over the
+                 device's capture buffer instead of a bytes copy. It is only
+                 valid until the next acquisition on this device.
 
         Returns:
             Tuple of (image_data, template_data).
 
         Raises:
-            ZKFingerError: If fingerprint acquisition fails after all retries.
+            ZKFingerError: If fingerprint acquisition fails after all retries,
+                          or straight away if the device was reported lost
+                          less than fatal_backoff seconds ago.
         """
         with self._lock:
             if self._closed:
                 raise ZKFingerError("Device is closed")
 
+            if (self._last_fatal_err is not None
+                    and time.monotonic() - self._last_fatal_ts < self.fatal_backoff):
+                raise ZKFingerError("Device unreachable (cached)", self._last_fatal_err)
+
             # Use cached image size if not provided
             if fp_image_size is None:
                 if self.image_size <= 0:
                     raise ZKFingerError("Unknown image size, please specify fp_image_size")
                 fp_image_size = self.image_size
 
-            for attempt in range(max_retries):
-                # Allocate buffers for the image and template
-                fp_image = (ctypes.c_ubyte * fp_image_size)()
-                fp_template = (ctypes.c_ubyte * fp_template_size)()
-                template_size = ctypes.c_uint(fp_template_size)
-
-                # Acquire fingerprint
-                ret = self.sdk.lib.ZKFPM_AcquireFingerprint(
-                    self.handle,
-                    ctypes.cast(fp_image, ctypes.POINTER(ctypes.c_ubyte)),
-                    fp_image_size,
-                    ctypes.cast(fp_template, ctypes.POINTER(ctypes.c_ubyte)),
-                    ctypes.byref(template_size)
-                )
-
-                if ret == ZKFP_ERR_OK:
-                    # Success
-                    image_data = bytes(fp_image)
-                    template_data = bytes(fp_template[:template_size.value])
-                    logger.info(f"Fingerprint acquired successfully on attempt {attempt + 1}, template size: {template_size.value} bytes")
-                    return image_data, template_data
-
-                elif ret == ZKFP_ERR_CAPTURE:
-                    # Failed to capture image, retry
-                    logger.debug(f"Attempt {attempt + 1}/{max_retries}: Failed to capture image, retrying in {retry_delay}s...")
-                    if attempt < max_retries - 1:
-                        time.sleep(retry_delay)
-                    else:
-                        error_msg = "Failed to capture fingerprint after maximum retries"
-                        logger.error(error_msg)
-                        raise ZKFingerError(error_msg, ret)
-
+        # An explicit timeout bounds the polling on its own
+        min_attempts = max_retries if timeout is None else 1
+        if timeout is None:
+            timeout = max_retries * retry_delay
+        deadline = time.monotonic() + timeout
+        delay = min(ACQ_BACKOFF_START, retry_delay)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            ret, result = self._capture_once(fp_image_size, fp_template_size, copy)
+
+            if ret == ZKFP_ERR_OK:
+                self._last_fatal_err = None
+                logger.info(f"Fingerprint acquired successfully on attempt {attempt}, template size: {len(result[1])} bytes")
+                return result
+
+            elif ret == ZKFP_ERR_CAPTURE:
+                # Failed to capture image; retry until both limits are used up.
+                # The device lock is not held while waiting, so LED and other
+                # parameter calls can run between polls.
+                if attempt < min_attempts or time.monotonic() + delay < deadline:
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"Attempt {attempt}: Failed to capture image, retrying in {delay}s...")
+                    time.sleep(delay)
+                    delay = min(delay * 2, retry_delay)
                 else:
-                    # Other error, don't retry
-                    error_msg = "Fingerprint acquisition failed"
-                    logger.error(f"{error_msg}: {ret}")
+                    # No finger yet; callers polling the sensor expect this
+                    error_msg = "Failed to capture fingerprint after maximum retries"
+                    logger.debug(error_msg)
                     raise ZKFingerError(error_msg, ret)
 
-            # This should not be reached due to the raise in the loop
-            raise ZKFingerError("Failed to acquire fingerprint")
+            else:
+                # Other error, don't retry
+                if ret in _FATAL_ACQUIRE_ERRORS:
+                    self._last_fatal_ts = time.monotonic()
+                    self._last_fatal_err = ret
+                error_msg = "Fingerprint acquisition failed"
+                logger.error(f"{error_msg}: {ret}")
+                raise ZKFingerError(error_msg, ret)
+
+    def _capture_once(self, fp_image_size: int, fp_template_size: int,
+                      copy: bool) -> Tuple[int, Tuple[bytes, bytes]]:
+        """
+        Make one ZKFPM_AcquireFingerprint call into the device buffers.
+
+        Holds the device lock for the call and for copying the result out of
+        the shared buffers.
+
+        Args:
+            fp_image_size: Size of the fingerprint image buffer in bytes.
+            fp_template_size: Size of the fingerprint template buffer in bytes.
+            copy: Whether to copy the image out (see acquire_fingerprint).
+
+        Returns:
+            Tuple of (SDK return code, (image_data, template_data)); the data
+            is None unless the return code is ZKFP_ERR_OK.
+
+        Raises:
+            ZKFingerError: If the device has been closed.
+        """
+        with self._lock:
+            if self._closed:
+                raise ZKFingerError("Device is closed")
+
+            # Reuse the device buffers, growing them once if a caller asks for more
+            if fp_image_size > len(self._image_buf):
+                self._image_buf = (ctypes.c_ubyte * fp_image_size)()
+            if fp_template_size > len(self._template_buf):
+                self._template_buf = (ctypes.c_ubyte * fp_template_size)()
+            fp_image = self._image_buf
+            fp_template = self._template_buf
+
+            # The SDK overwrites the size with the template length
+            template_size = self._template_size
+            template_size.value = fp_template_size
+
+            ret = self.sdk._c_acquire(
+                self.handle,
+                fp_image,
+                fp_image_size,
+                fp_template,
+                self._template_size_ref
+            )
+            if ret != ZKFP_ERR_OK:
+                return ret, None
+
+            # Copy out only the requested sizes, the buffers may be larger
+            if copy:
+                image_data = ctypes.string_at(fp_image, fp_image_size)
+            else:
+                image_data = memoryview(fp_image).cast('B')[:fp_image_size].toreadonly()
+            template_data = ctypes.string_at(fp_template, template_size.value)
+            return ret, (image_data, template_data)
 
     def set_parameter(self, param_code: int, value: int) -> bool:
         """
@@ -864,16 +1016,14 @@ class FingerprintDevice:
             if self._closed:
                 raise ZKFingerError("Device is closed")
 
-            # Convert value to bytes
-            c_value = ctypes.c_int(value)
-            param_bytes = (ctypes.c_ubyte * ctypes.sizeof(c_value))()
-            ctypes.memmove(param_bytes, ctypes.byref(c_value), ctypes.sizeof(c_value))
+            # Write the value through the int view of the scratch buffer
+            self._param_int.value = value
 
-            ret = self.sdk.lib.ZKFPM_SetParameters(
+            ret = self.sdk._c_set_parameters(
                 self.handle,
                 param_code,
-                param_bytes,
-                ctypes.sizeof(c_value)
+                self._param_buf,
+                ctypes.sizeof(self._param_buf)
             )
 
             if ret != ZKFP_ERR_OK:
@@ -881,13 +1031,27 @@ class FingerprintDevice:
                 logger.error(f"{error_msg}: {ret}")
                 raise ZKFingerError(error_msg, ret)
 
-            logger.debug(f"Set parameter {param_code} to {value}")
+            # A write can change other read values too (DPI changes the image
+            # size), so every cached read is dropped
+            self._param_cache.clear()
+
+            if param_code == PARAM_CODE_DPI:
+                # Re-read the geometry on next access
+                self.__dict__.pop('device_geometry', None)
+            elif param_code in _CACHED_WRITE_PARAMS:
+                self._param_state[param_code] = value
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Set parameter {param_code} to {value}")
             return True
 
     def get_parameter(self, param_code: int) -> int:
         """
         Get a device parameter.
 
+        Values read within the last param_cache_ttl seconds are returned
+        without another SDK call; any successful set_parameter clears them.
+
         Args:
             param_code: Parameter code.
 
@@ -901,15 +1065,19 @@ class FingerprintDevice:
             if self._closed:
                 raise ZKFingerError("Device is closed")
 
-            # Prepare buffer for parameter value
-            param_bytes = (ctypes.c_ubyte * 4)()
-            param_size = ctypes.c_uint(4)
+            cached = self._param_cache.get(param_code)
+            if cached is not None and time.monotonic() < cached[1]:
+                return cached[0]
+
+            # Reset the scratch buffer for the parameter value
+            self._param_int.value = 0
+            self._param_size.value = ctypes.sizeof(self._param_buf)
 
-            ret = self.sdk.lib.ZKFPM_GetParameters(
+            ret = self.sdk._c_get_parameters(
                 self.handle,
                 param_code,
-                param_bytes,
-                ctypes.byref(param_size)
+                self._param_buf,
+                self._param_size_ref
             )
 
             if ret != ZKFP_ERR_OK:
@@ -917,11 +1085,28 @@ class FingerprintDevice:
                 logger.error(f"{error_msg}: {ret}")
                 raise ZKFingerError(error_msg, ret)
 
-            # Convert bytes to int
-            value = ctypes.cast(param_bytes, ctypes.POINTER(ctypes.c_int)).contents.value
-            logger.debug(f"Got parameter {param_code} = {value}")
+            # Read the bytes back as an int
+            value = self._param_int.value
+            if self.param_cache_ttl > 0:
+                self._param_cache[param_code] = (value, time.monotonic() + self.param_cache_ttl)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Got parameter {param_code} = {value}")
             return value
 
+    def _set_param_if_changed(self, param_code: int, value: int):
+        """
+        Set a write-only parameter unless the device already has that value.
+
+        Args:
+            param_code: One of the codes in _CACHED_WRITE_PARAMS.
+            value: Parameter value.
+
+        Raises:
+            ZKFingerError: If setting the parameter fails.
+        """
+        if self._param_state.get(param_code) != value:
+            self.set_parameter(param_code, value)
+
     def set_led(self, white: bool = False, green: bool = False, red: bool = False) -> bool:
         """
         Control the device LEDs.
@@ -938,20 +1123,10 @@ class FingerprintDevice:
             ZKFingerError: If setting the LEDs fails.
         """
         try:
-            if white:
-                self.set_parameter(PARAM_CODE_WHITE_LIGHT, 1)
-            else:
-                self.set_parameter(PARAM_CODE_WHITE_LIGHT, 0)
-
-            if green:
-                self.set_parameter(PARAM_CODE_GREEN_LIGHT, 1)
-            else:
-                self.set_parameter(PARAM_CODE_GREEN_LIGHT, 0)
-
-            if red:
-                self.set_parameter(PARAM_CODE_RED_LIGHT, 1)
-            else:
-                self.set_parameter(PARAM_CODE_RED_LIGHT, 0)
+            for param_code, enabled in ((PARAM_CODE_WHITE_LIGHT, white),
+                                        (PARAM_CODE_GREEN_LIGHT, green),
+                                        (PARAM_CODE_RED_LIGHT, red)):
+                self._set_param_if_changed(param_code, 1 if enabled else 0)
 
             return True
         except ZKFingerError as e:
@@ -972,10 +1147,8 @@ class FingerprintDevice:
             ZKFingerError: If setting the buzzer fails.
         """
         try:
-            if enabled:
-                self.set_parameter(PARAM_CODE_BUZZER, 1)
-            else:
-                self.set_parameter(PARAM_CODE_BUZZER, 0)
+            # Always sent: writing 1 starts a new beep even if the last write was 1
+            self.set_parameter(PARAM_CODE_BUZZER, 1 if enabled else 0)
 
             return True
         except ZKFingerError as e:
@@ -996,10 +1169,7 @@ class FingerprintDevice:
             ZKFingerError: If setting the template format fails.
         """
         try:
-            if iso_format:
-                self.set_parameter(PARAM_CODE_FORMAT, 1)
-            else:
-                self.set_parameter(PARAM_CODE_FORMAT, 0)
+            self._set_param_if_changed(PARAM_CODE_FORMAT, 1 if iso_format else 0)
 
             return True
         except ZKFingerError as e: